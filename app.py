@@ -6,6 +6,9 @@
 ###############################################################################
 import datetime
 import os
+import re
+import posixpath
+import time
 import streamlit as st
 from collections import defaultdict
 import pandas as pd
@@ -314,6 +317,17 @@ def render_desktop_assistant():
     with col2:
         st.subheader("⌨️ Type")
         typed = st.text_input("Enter command", key="da_type")
+        if typed and "wikipedia" not in typed.lower():
+            match = pc_task.match_command(typed)
+            fuzzy = None if match else pc_task.get_intent_classifier().classify(typed)
+            if match:
+                st.caption(f"Will run: **{pc_task.TASK_REGISTRY[match[0]]['desc']}** (matched “{match[1]}”)")
+            elif fuzzy:
+                st.caption(f"Will run: **{pc_task.TASK_REGISTRY[fuzzy[0]]['desc']}** (fuzzy match, confidence {fuzzy[1]:.2f})")
+            else:
+                guesses = pc_task.get_intent_classifier().scores(typed)
+                st.caption("No confident match." + (" Closest: " + ", ".join(
+                    f"{pc_task.TASK_REGISTRY[k]['desc']} ({c:.2f})" for k, c in guesses) if guesses else ""))
         if st.button("Run"):
             if typed:
                 with st.spinner("Executing…"):
@@ -335,6 +349,24 @@ def render_desktop_assistant():
                         pc_task.speak(out)
                         st.success(f"**Result:** {out}")
 
+    with st.sidebar.expander("🔊 Speech"):
+        worker = pc_task.get_speech_worker()
+        if worker.error:
+            st.error(worker.error)
+        st.caption(f"Driver: {worker.driver} · {worker.queue_depth()} queued · "
+                   f"{worker.spoken} spoken · {worker.dropped} dropped")
+        worker.max_queue = st.number_input("Max queued utterances (0 = no cap)", 0, 50, worker.max_queue)
+        worker.interrupt_stale = st.checkbox("New speech interrupts the current one", worker.interrupt_stale)
+        if st.button("🔇 Stop speaking"):
+            worker.stop()
+
+    with st.expander("⚡ Phrase index"):
+        st.caption(f"{pc_task.get_phrase_index().n_phrases} phrases in one Aho-Corasick automaton; "
+                   "the most specific phrase in a command wins.")
+        if st.button("Benchmark against a 10k-phrase registry"):
+            with st.spinner("Benchmarking…"):
+                st.json(pc_task.benchmark_phrase_matching())
+
 # ------------------ 5-C  File Manager ------------------
 def render_file_manager():
     st.title("📂 Advanced File Manager")
@@ -355,16 +387,65 @@ def render_file_manager():
     cur = st.session_state.fm_dir
     st.info(f"**Location:** `{cur}`")
 
-    df = file_manager.list_files_as_dataframe(cur)
-    if isinstance(df, str):
-        st.error(df)
+    with st.sidebar.expander("⚡ Live Index"):
+        index = file_manager.find_file_index(cur)
+        if st.button("Index & watch this folder"):
+            with st.spinner("Building index…"):
+                index = file_manager.get_file_index(cur)
+        if index:
+            st.caption(f"Root: `{index.root}`")
+            st.json(index.get_metrics())
+
+    c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+    q = c1.text_input("Search files/folders")
+    sort_by = c2.selectbox("Sort by", file_manager.LISTING_SORT_OPTIONS)
+    page_size = c3.selectbox("Page size", [50, 100, 250, 500], index=1)
+    descending = c4.checkbox("Descending")
+    whole_tree = index is not None and st.checkbox("Search the whole indexed tree")
+    if q and whole_tree:
+        st.dataframe(index.search(q), use_container_width=True)
+
+    # In "Directory order" only the current page is read, so first paint doesn't depend on
+    # folder size; the sorted orders have to scan the folder once (then reuse it while unchanged).
+    listing_key = (cur, q, whole_tree, sort_by, descending, page_size)
+    if st.session_state.get("fm_listing_key") != listing_key:
+        st.session_state.fm_listing_key = listing_key
+        st.session_state.fm_page = 0
+    result = file_manager.get_directory_page(cur, st.session_state.fm_page, page_size, sort_by,
+                                             descending, None if whole_tree else q)
+    if isinstance(result, str):
+        st.error(result)
         return
-
-    q = st.text_input("Search files/folders")
-    if q:
-        df = df[df['Name'].str.contains(q, case=False)]
-
-    st.dataframe(df, use_container_width=True)
+    df, total, n_folders = result
+    if total is None:
+        # Still being counted in the background; allow paging on while pages come back full.
+        n_pages = st.session_state.fm_page + (2 if len(df) == page_size else 1)
+        st.caption(f"Counting items… · page {st.session_state.fm_page + 1}")
+    else:
+        n_pages = max(1, -(-total // page_size))
+        st.caption(f"{total} items ({n_folders} folders, {total - n_folders} files) · "
+                   f"page {st.session_state.fm_page + 1} of {n_pages}")
+    table = st.empty()
+    table.dataframe(df, use_container_width=True)
+    z1, z2 = st.columns([1, 3])
+    if z1.checkbox("Compute folder sizes"):
+        # Sizes are filled in as each folder finishes; unchanged subtrees come from cache.
+        refresh_sizes = z2.button("Recount from disk")
+        z2.caption("Cached per folder until an entry is added, removed or renamed; "
+                   "files that grew in place need a recount.")
+        engine = file_manager.get_folder_size_engine()
+        folder_rows = df.index[df['Type'] == '📁 Folder']
+        row_of = {df.at[i, 'Name']: i for i in folder_rows}
+        for name, size in engine.iter_folder_sizes(cur, list(row_of), refresh=refresh_sizes):
+            df.at[row_of[name], 'Size'] = "?" if size is None else file_manager.get_human_readable_size(size)
+            table.dataframe(df, use_container_width=True)
+    p1, p2, _ = st.columns([1, 1, 6])
+    if p1.button("◀ Prev", disabled=st.session_state.fm_page == 0):
+        st.session_state.fm_page -= 1
+        st.rerun()
+    if p2.button("Next ▶", disabled=st.session_state.fm_page >= n_pages - 1):
+        st.session_state.fm_page += 1
+        st.rerun()
 
     with st.expander("Actions", expanded=True):
         col1, col2 = st.columns(2)
@@ -387,26 +468,290 @@ def render_file_manager():
             st.subheader("Upload / Download / Preview")
             up = st.file_uploader("Upload file")
             if up:
-                with open(os.path.join(cur, up.name), "wb") as f:
-                    f.write(up.getbuffer())
-                st.success("Uploaded!")
+                # Saved once per upload; later reruns just show the stored result.
+                upload_key = (up.file_id, cur)
+                saved_key, message = st.session_state.get("fm_uploaded", (None, None))
+                if saved_key != upload_key:
+                    message = file_manager.save_uploaded_file(up, cur)
+                    st.session_state.fm_uploaded = (upload_key, message)
+                (st.error if message.startswith("Error") else st.success)(message)
 
             files = df[df['Type'] == '📄 File']['Name'].tolist()
             if files:
                 dl = st.selectbox("Download file", files)
-                try:
-                    with open(os.path.join(cur, dl), "rb") as f:
-                        st.download_button("Download", data=f, file_name=dl)
-                except Exception as e:
-                    st.error(str(e))
+                dl_path = os.path.join(cur, dl)
+                if st.button("Prepare download"):
+                    prepared = file_manager.prepare_download(dl_path)
+                    if isinstance(prepared, str):
+                        st.error(prepared)
+                    elif prepared is None:
+                        st.session_state.fm_big_download = dl_path
+                    else:
+                        data, digest = prepared
+                        st.caption(f"{file_manager.CHECKSUM_ALGORITHM}: `{digest}`")
+                        st.download_button("Download", data=data, file_name=dl)
+                if st.session_state.get("fm_big_download") == dl_path:
+                    st.warning("File is too large to buffer for a browser download. "
+                               "Copy it to a local folder instead (streamed in chunks).")
+                    target = st.text_input("Copy to folder", os.path.expanduser("~"))
+                    if st.button("Copy file"):
+                        st.info(file_manager.copy_file_streaming(dl_path, os.path.join(target, dl)))
 
                 pv = st.selectbox("Preview file", [""] + files)
                 if pv:
                     path = os.path.join(cur, pv)
-                    if path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        st.image(path)
+                    if path.lower().endswith(file_manager.THUMBNAIL_EXTENSIONS):
+                        if st.checkbox("Show full resolution"):
+                            st.image(path)
+                        else:
+                            st.image(file_manager.get_thumbnail(path) or path)
                     else:
-                        st.code(file_manager.get_file_content_for_preview(path))
+                        mode = st.radio("Preview window", file_manager.PREVIEW_MODES, horizontal=True)
+                        line_no, offset = 0, 0
+                        if mode == "Jump to line":
+                            line_no = st.number_input("Line number (1-based)", min_value=1, value=1) - 1
+                        elif mode == "Jump to byte offset":
+                            offset = st.number_input("Byte offset", min_value=0, value=0)
+                        preview = file_manager.preview_file(path, mode, offset=offset, line=line_no)
+                        if isinstance(preview, str):
+                            st.error(preview)
+                        else:
+                            label = "binary (hex dump)" if preview["kind"] == "binary" else preview["encoding"]
+                            st.caption(f"{label} · bytes {preview['start']:,}–{preview['end']:,} of "
+                                       f"{file_manager.get_human_readable_size(preview['size'])}"
+                                       + (" · truncated" if preview["truncated"] else ""))
+                            st.code(preview["content"], language=None)
+
+    with st.expander("🧺 Batch Operations", expanded=bool(file_manager.get_file_operation_queue().list_jobs())):
+        selected = st.multiselect("Select items", df['Name'].tolist())
+        b1, b2 = st.columns([1, 3])
+        op = b1.selectbox("Operation", file_manager.FILE_OPERATIONS)
+        op_dst = b2.text_input("Destination folder (move/copy)", key="fm_op_dst")
+        if selected and st.button(f"Queue {op.lower()} of {len(selected)} items"):
+            if op != "Delete" and not op_dst:
+                st.warning("Choose a destination folder.")
+            else:
+                file_manager.get_file_operation_queue().submit(op, cur, selected, op_dst or None)
+                st.rerun()
+        jobs = file_manager.get_file_operation_queue().list_jobs()
+        if jobs:
+            st.dataframe(pd.DataFrame([j.summary() for j in jobs]), use_container_width=True)
+            active = [j for j in jobs if j.status in ("queued", "running")]
+            for j in active:
+                if st.button(f"⏹ Cancel job {j.id}", key=f"fm_cancel_{j.id}"):
+                    file_manager.get_file_operation_queue().cancel(j.id)
+            for j in jobs:
+                for err in j.errors:
+                    st.caption(f"⚠️ {j.id}: {err}")
+            if active and st.button("🔄 Refresh progress"):
+                st.rerun()
+
+    with st.expander("📦 Download Folder as ZIP"):
+        folders = ["(this folder)"] + df[df['Type'] == '📁 Folder']['Name'].tolist()
+        zip_choice = st.selectbox("Folder to archive", folders)
+        zip_dir = cur if zip_choice == "(this folder)" else os.path.join(cur, zip_choice)
+        zip_name = (os.path.basename(zip_dir.rstrip(os.sep)) or "archive") + ".zip"
+        st.caption(f"Folders up to {file_manager.get_human_readable_size(file_manager.DOWNLOAD_BUFFER_LIMIT)} are "
+                   "zipped in memory for the browser download; larger ones are streamed to a folder on disk.")
+        if st.button("Prepare archive"):
+            folder_bytes = file_manager.get_folder_size_engine().folder_size(zip_dir)
+            if folder_bytes <= file_manager.DOWNLOAD_BUFFER_LIMIT:
+                with st.spinner("Zipping…"):
+                    data = b"".join(file_manager.stream_zip_folder(zip_dir))
+                st.download_button(f"Download {zip_name}", data=data, file_name=zip_name, mime="application/zip")
+            else:
+                st.session_state.fm_big_zip = zip_dir
+        if st.session_state.get("fm_big_zip") == zip_dir:
+            st.warning("Folder is too large to buffer for a browser download. "
+                       "The archive can be streamed straight to a local folder instead.")
+            zip_target = st.text_input("Save archive to folder", os.path.expanduser("~"))
+            if st.button("Save archive"):
+                with st.spinner("Streaming archive…"):
+                    st.info(file_manager.save_zip_folder(zip_dir, os.path.join(zip_target, zip_name)))
+
+    with st.expander("🔁 Sync / Mirror"):
+        sync_dst = st.text_input("Destination folder", key="fm_sync_dst")
+        s1, s2, s3 = st.columns(3)
+        sync_hash = s1.checkbox("Verify by hash")
+        sync_mirror = s2.checkbox("Delete extras in destination")
+        sync_dry = s3.checkbox("Dry run", value=True)
+        s4, s5 = st.columns(2)
+        sync_workers = s4.slider("Parallel copies", 1, 16, 4)
+        sync_rate = s5.number_input("Bandwidth limit (MB/s, 0 = unlimited)", min_value=0.0, value=0.0)
+        if sync_dst and st.button("Compare" if sync_dry else "Run sync"):
+            if sync_dry:
+                with st.spinner("Comparing trees…"):
+                    plan = file_manager.compare_trees(cur, sync_dst, sync_hash, sync_mirror)
+                copies = [m for m in plan if m["action"] == "copy"]
+                st.caption(f"{len(copies)} copies ({file_manager.get_human_readable_size(sum(m['bytes'] for m in copies))}), "
+                           f"{sum(m['action'] == 'delete' for m in plan)} deletes, "
+                           f"{sum(m['action'] == 'mkdir' for m in plan)} new folders, "
+                           f"{sum(m['action'] == 'link' for m in plan)} symlinks, "
+                           f"{sum(m['action'] == 'skip' for m in plan)} special files skipped")
+                st.dataframe(file_manager.sync_plan_to_dataframe(plan), use_container_width=True)
+            else:
+                st.session_state.fm_sync_job = file_manager.start_sync(
+                    cur, sync_dst, sync_hash, sync_mirror, sync_workers, sync_rate)
+        job = st.session_state.get("fm_sync_job")
+        if job is not None:
+            bar, info = st.progress(0.0), st.empty()
+            if job.is_running() and st.button("⏹ Cancel sync"):
+                job.cancel()
+            while True:
+                prog = job.progress()
+                bar.progress(min(prog["fraction"], 1.0))
+                info.caption(f"{prog['actions_done']}/{prog['actions_total']} actions · "
+                             f"{file_manager.get_human_readable_size(prog['bytes_done'])} of "
+                             f"{file_manager.get_human_readable_size(prog['bytes_total'])} · {prog['mb_per_s']} MB/s")
+                if not job.is_running():
+                    break
+                time.sleep(0.25)
+            for err in prog["errors"]:
+                st.error(err)
+
+    with st.expander("🗂️ Smart Organizer"):
+        o1, o2 = st.columns(2)
+        by_date = o1.checkbox("Group by month", value=True)
+        recursive = o2.checkbox("Include subfolders")
+        if st.button("Build organize plan"):
+            st.session_state.fm_plan = (cur, file_manager.build_organize_plan(cur, by_date=by_date, recursive=recursive))
+        plan_root, plan = st.session_state.get("fm_plan", (None, None))
+        if plan_root == cur and plan:
+            st.dataframe(file_manager.organize_plan_to_dataframe(plan, cur), use_container_width=True)
+            if st.button(f"✅ Approve & move {len(plan)} files", type="primary"):
+                with st.spinner("Moving files…"):
+                    st.success(file_manager.execute_organize_plan(plan, cur))
+                st.session_state.fm_plan = (None, None)
+        elif plan_root == cur:
+            st.info("Nothing to organize here.")
+
+        journal = file_manager.get_organize_journal_status(cur)
+        if journal:
+            st.caption("Last run: " + ", ".join(f"{n} {state}" for state, n in journal.items()))
+            r1, r2 = st.columns(2)
+            if (journal.get("planned") or journal.get("failed")) and r1.button("▶ Resume interrupted run"):
+                st.info(file_manager.resume_organize(cur))
+            if (journal.get("done") or journal.get("undo_failed")) and r2.button("↩ Roll back last run"):
+                st.info(file_manager.rollback_organize(cur))
+
+    with st.expander("🔎 Search Inside Files"):
+        g1, g2, g3, g4 = st.columns([3, 1, 1, 1])
+        pattern = g1.text_input("Text or pattern", key="fm_grep_pattern")
+        use_regex = g2.checkbox("Regex")
+        ignore_case = g3.checkbox("Ignore case", value=True)
+        context = g4.number_input("Context lines", min_value=0, max_value=5, value=1)
+        globs = st.text_input("Ignore globs (comma-separated)", ", ".join(file_manager.GREP_IGNORE_GLOBS))
+        if pattern and st.button("Search contents"):
+            st.button("⏹ Stop")  # clicking reruns the script, which closes the search below
+            status, results = st.empty(), st.empty()
+            rows = []
+            try:
+                for m in file_manager.search_file_contents(
+                        cur, pattern, use_regex, ignore_case, context,
+                        [g.strip() for g in globs.split(",") if g.strip()]):
+                    rows.append([os.path.relpath(m["path"], cur), m["line"], m["text"], m["before"], m["after"]])
+                    if len(rows) % 25 == 1:
+                        status.caption(f"{len(rows)} matches so far…")
+                        results.dataframe(pd.DataFrame(rows, columns=["File", "Line", "Match", "Before", "After"]),
+                                          use_container_width=True)
+            except re.error as e:
+                st.error(f"Invalid pattern: {e}")
+            status.caption(f"{len(rows)} matches.")
+            results.dataframe(pd.DataFrame(rows, columns=["File", "Line", "Match", "Before", "After"]),
+                              use_container_width=True)
+
+    with st.expander("📊 Biggest Folders"):
+        b1, b2 = st.columns(2)
+        recount = b2.button("Recount from disk", key="fm_biggest_recount")
+        if b1.button("Find biggest folders here") or recount:
+            with st.spinner("Measuring folders…"):
+                st.dataframe(file_manager.get_folder_size_engine().biggest_folders(cur, refresh=recount)[["Folder", "Size"]],
+                             use_container_width=True)
+
+    with st.expander("📈 Storage Analytics"):
+        # Expander bodies run on every rerun, so the snapshot is only read on a click and the
+        # aggregated views are kept in session state for this folder.
+        d1, d2 = st.columns(2)
+        rescan = d1.button("Scan / rescan this tree")
+        if rescan or d2.button("Load last snapshot"):
+            with st.spinner("Scanning tree…" if rescan else "Loading snapshot…"):
+                scan = file_manager.get_tree_scan(cur, refresh=True) if rescan else file_manager.load_tree_snapshot(cur)
+            dashboard = None
+            if scan is not None:
+                tree_df, scanned_at = scan
+                dashboard = {"files": len(tree_df), "bytes": int(tree_df["size"].sum()), "scanned_at": scanned_at}
+                if len(tree_df):
+                    dashboard.update(ext=file_manager.tree_extension_summary(tree_df),
+                                     sizes=file_manager.tree_size_histogram(tree_df),
+                                     ages=file_manager.tree_age_buckets(tree_df),
+                                     largest=file_manager.tree_largest_files(tree_df))
+            st.session_state.fm_tree_dashboard = (cur, dashboard)
+        dash_root, dashboard = st.session_state.get("fm_tree_dashboard", (None, None))
+        if dash_root != cur:
+            st.caption("Load the last snapshot or scan this tree to build the dashboard.")
+        elif dashboard is None:
+            st.caption("No snapshot for this folder yet – scan it to build the dashboard.")
+        else:
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Files", f"{dashboard['files']:,}")
+            m2.metric("Total size", file_manager.get_human_readable_size(dashboard["bytes"]))
+            m3.metric("Snapshot from", dashboard["scanned_at"].strftime("%Y-%m-%d %H:%M"))
+            if dashboard["files"]:
+                st.plotly_chart(px.bar(dashboard["ext"], x="ext", y="bytes", hover_data=["files"],
+                                       title="Space by extension"), use_container_width=True)
+                a1, a2 = st.columns(2)
+                with a1:
+                    st.plotly_chart(px.bar(dashboard["sizes"], x="bucket", y="files",
+                                           title="File size distribution"), use_container_width=True)
+                with a2:
+                    st.plotly_chart(px.bar(dashboard["ages"], x="age", y="bytes",
+                                           title="Space by last-modified age"), use_container_width=True)
+                st.subheader("Largest files")
+                st.dataframe(dashboard["largest"], use_container_width=True)
+
+    with st.expander("🧬 Duplicate Finder"):
+        if st.button("Scan this folder for duplicates"):
+            with st.spinner("Hashing candidate files…"):
+                st.session_state.fm_duplicates = (cur, file_manager.find_duplicate_files(cur))
+        dup_root, groups = st.session_state.get("fm_duplicates", (None, None))
+        if dup_root == cur:
+            if isinstance(groups, str):
+                st.error(groups)
+            elif not groups:
+                st.success("No duplicate files found.")
+            else:
+                reclaim = sum(g["reclaimable"] for g in groups)
+                st.metric("Reclaimable space", file_manager.get_human_readable_size(reclaim),
+                          f"{len(groups)} duplicate groups", delta_color="off")
+                st.dataframe(file_manager.duplicates_to_dataframe(groups, cur), use_container_width=True)
+
+    with st.expander("🖼️ Image Grid"):
+        # Listing a huge folder is a full scan, so it only happens when the grid is switched on
+        # and is reused until the folder changes.
+        images = []
+        if st.checkbox("Show image thumbnails", key="fm_show_images"):
+            try:
+                listing_key = (cur, os.stat(cur).st_mtime_ns)
+            except OSError:
+                listing_key = (cur, None)
+            cached_key, images = st.session_state.get("fm_image_list", (None, []))
+            if cached_key != listing_key:
+                images = file_manager.list_image_files(cur)
+                st.session_state.fm_image_list = (listing_key, images)
+            if not images:
+                st.caption("No images in this folder.")
+        if images:
+            st.caption(f"{len(images)} images")
+            per_page = 24
+            n_pages = max(1, -(-len(images) // per_page))
+            grid_page = st.number_input("Grid page", min_value=1, max_value=n_pages, value=1) - 1
+            batch = images[grid_page * per_page:(grid_page + 1) * per_page]
+            thumbs = file_manager.get_thumbnail_cache().get_many([os.path.join(cur, n) for n in batch])
+            cols = st.columns(6)
+            for i, name in enumerate(batch):
+                thumb = thumbs.get(os.path.join(cur, name))
+                if thumb:
+                    cols[i % 6].image(thumb, caption=name, use_container_width=True)
 
 # ------------------ 5-D  SSH Assistant ------------------
 def render_ssh_assistant():
@@ -418,17 +763,27 @@ def render_ssh_assistant():
     st.info(f"Target Server: **{SSH_USER}@{SSH_IP}**.  All commands require confirmation.")
     st.markdown("---")
 
-    tab1, tab2 = st.tabs(["🤖 AI Assistant", "📋 Command Menu"])
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(["🤖 AI Assistant", "📋 Command Menu", "🌐 Fleet", "🩺 Snapshot",
+                                                        "📈 Metrics", "📦 SFTP", "🗂️ Remote Files"])
 
     with tab1:
         st.subheader("Describe Your Task")
         prompt = st.text_area("Describe what you want to do:", key="ssh_prompt")
         if st.button("Generate Command", key="ssh_generate"):
             if prompt:
+                resolver = ssh_gemini_manager.get_command_resolver(COMMAND_MENU)
                 with st.spinner("Generating…"):
-                    st.session_state.cmd = ssh_gemini_manager.get_linux_command_from_gemini(gemini_model, prompt)
+                    cmd, source, detail = resolver.resolve(gemini_model, prompt)
+                st.session_state.cmd = cmd
+                st.session_state.cmd_source = f"{source}: {detail}"
             else:
                 st.warning("Please enter a task description.")
+        if st.session_state.get("cmd_source"):
+            st.caption(f"Answered from {st.session_state.cmd_source}")
+        stats = ssh_gemini_manager.get_command_resolver(COMMAND_MENU).stats()
+        if stats["requests"]:
+            st.caption(f"{stats['menu_hits']} menu matches · {stats['cache_hits']} cache hits · "
+                       f"{stats['gemini_calls']} Gemini calls · {stats['llm_calls_avoided_pct']}% of LLM calls avoided")
 
     with tab2:
         st.subheader("Select a Pre-defined Command")
@@ -437,32 +792,322 @@ def render_ssh_assistant():
                 for desc, cmd in commands.items():
                     if st.button(desc, key=cmd, use_container_width=True):
                         st.session_state.cmd = cmd
+                        st.session_state.cmd_source = None
+
+    with tab3:
+        st.subheader("Run a command on many hosts")
+        inventory = ssh_gemini_manager.load_host_inventory()
+        with st.expander("Host inventory", expanded=not inventory):
+            h1, h2, h3, h4 = st.columns([2, 2, 1, 2])
+            new_name = h1.text_input("Name", key="fleet_name")
+            new_host = h2.text_input("Host / IP", key="fleet_host")
+            new_port = h3.number_input("Port", 1, 65535, 22, key="fleet_port")
+            new_user = h4.text_input("User (blank = default)", key="fleet_user")
+            new_pass = st.text_input("Password (blank = default)", type="password", key="fleet_pass")
+            if st.button("Add / update host") and new_name and new_host:
+                inventory = ssh_gemini_manager.add_host_to_inventory(new_name, new_host, new_port, new_user, new_pass)
+            if inventory:
+                st.dataframe(pd.DataFrame(inventory)[["name", "host", "port", "username"]], use_container_width=True)
+                drop = st.selectbox("Remove host", [""] + [h["name"] for h in inventory])
+                if drop and st.button("Remove"):
+                    inventory = ssh_gemini_manager.remove_host_from_inventory(drop)
+                    st.rerun()
+        if inventory:
+            targets = st.multiselect("Target hosts", [h["name"] for h in inventory],
+                                     default=[h["name"] for h in inventory])
+            menu_items = {f"{cat} › {desc}": cmd for cat, cmds in COMMAND_MENU.items() for desc, cmd in cmds.items()}
+            fleet_choice = st.selectbox("Command", list(menu_items))
+            fleet_cmd = st.text_input("Command to run", menu_items[fleet_choice], key="fleet_cmd")
+            f1, f2 = st.columns(2)
+            concurrency = f1.slider("Max concurrent hosts", 1, 64, 10)
+            host_timeout = f2.number_input("Per-host timeout (s)", 1, 600, 15)
+            if st.button("🚀 Run on selected hosts", type="primary") and targets and fleet_cmd:
+                chosen = [h for h in inventory if h["name"] in targets]
+                with st.spinner(f"Running on {len(chosen)} hosts…"):
+                    results, timing = ssh_gemini_manager.run_on_hosts(
+                        chosen, fleet_cmd, concurrency, host_timeout, SSH_USER, SSH_PASS)
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Wall clock", f"{timing['wall_s']} s")
+                m2.metric("Sum of latencies", f"{timing['sum_latency_s']} s")
+                m3.metric("Parallel speed-up", f"{timing['speedup']}×")
+                st.dataframe(results[["name", "host", "status", "exit_status", "latency_s"]], use_container_width=True)
+                st.subheader("Grouped by identical output")
+                for _, group in ssh_gemini_manager.group_identical_outputs(results).iterrows():
+                    with st.expander(f"{group['count']} host(s): {group['hosts']}"):
+                        st.code(group["output"], language="bash")
+
+    with tab4:
+        st.subheader("System snapshot (one round trip)")
+        if st.button("📸 Take snapshot"):
+            with st.spinner("Collecting…"):
+                st.session_state.ssh_snapshot = ssh_gemini_manager.collect_system_snapshot(SSH_IP, 22, SSH_USER, SSH_PASS)
+        snap = st.session_state.get("ssh_snapshot")
+        if isinstance(snap, str):
+            st.error(snap)
+        elif snap:
+            st.caption(f"**{snap['hostname']}** · {snap['kernel']} · collected in {snap['collected_in_s']} s")
+            c1, c2, c3, c4 = st.columns(4)
+            if snap["uptime_s"] is not None:
+                c1.metric("Uptime", str(datetime.timedelta(seconds=int(snap["uptime_s"]))))
+            if snap["load"]:
+                c2.metric("Load (1/5/15 min)", " / ".join(f"{v:.2f}" for v in snap["load"]),
+                          f"{snap['cpus']} CPUs", delta_color="off")
+            mem = snap["memory"]
+            if not mem.empty:
+                ram = mem[mem["kind"] == "Mem"].iloc[0]
+                c3.metric("Memory used", f"{ram['used'] / ram['total']:.0%}" if ram["total"] else "-",
+                          file_manager.get_human_readable_size(int(ram["total"])), delta_color="off")
+            c4.metric("TCP established", snap["sockets"].get("tcp_estab", "-"),
+                      f"{snap['users']} users logged in", delta_color="off")
+            if not snap["disks"].empty:
+                st.plotly_chart(px.bar(snap["disks"], x="mount", y="use_pct", range_y=[0, 100],
+                                       hover_data=["filesystem"], title="Disk usage (%)"),
+                                use_container_width=True)
+            p1, p2 = st.columns(2)
+            with p1:
+                st.markdown("**Top CPU processes**")
+                st.dataframe(snap["top_cpu"], use_container_width=True)
+            with p2:
+                st.markdown("**Top memory processes**")
+                st.dataframe(snap["top_mem"], use_container_width=True)
+
+    with tab5:
+        st.subheader("Resource trends")
+        interval = st.slider("Sample interval (s)", 1, 60, 5)
+        poller = ssh_gemini_manager.get_metrics_poller(SSH_IP, 22, SSH_USER, SSH_PASS, interval)
+        m1, m2, m3 = st.columns(3)
+        if poller.is_running():
+            if m1.button("⏹ Stop polling"):
+                poller.stop()
+                st.rerun()
+        elif m1.button("▶ Start polling", type="primary"):
+            poller.start()
+            st.rerun()
+        m2.button("🔄 Refresh charts")
+        m3.caption(f"{'Polling' if poller.is_running() else 'Stopped'} · {len(poller.ring)} live samples · "
+                   f"last round trip {poller.last_latency_s or '-'} s · {poller.errors} errors")
+        if poller.last_error:
+            st.caption(f"Last error: {poller.last_error}")
+        window = st.radio("Window", ["Live (in memory)", "Last 24 h (stored)"], horizontal=True)
+        series = poller.recent() if window.startswith("Live") else poller.store.history(SSH_IP)
+        if series.empty:
+            st.info("No samples yet. Start polling to collect data.")
+        else:
+            st.plotly_chart(px.line(series, x="time", y=["cpu_pct", "mem_pct", "disk_pct"],
+                                    labels={"value": "%", "variable": "metric"}, range_y=[0, 100]),
+                            use_container_width=True)
+
+    with tab6:
+        st.subheader("Transfer files over SFTP")
+        x1, x2 = st.columns(2)
+        direction = x1.radio("Direction", ["Upload", "Download"], horizontal=True, key="sftp_direction")
+        streams = x2.slider("Parallel streams", 1, ssh_gemini_manager.SFTP_STREAMS, ssh_gemini_manager.SFTP_STREAMS)
+        upload = direction == "Upload"
+        source = st.text_input("Local file or folder" if upload else "Remote file or folder", key="sftp_source")
+        destination = st.text_input("Remote destination" if upload else "Local destination", key="sftp_destination")
+        verify = st.checkbox("Verify SHA-256 after transfer", value=True)
+        st.caption("Interrupted large transfers resume when started again with the same paths.")
+        b1, b2 = st.columns(2)
+        if source and destination and b1.button("Start transfer", type="primary"):
+            st.session_state.sftp_job = ssh_gemini_manager.start_sftp_transfer(
+                direction.lower(), SSH_IP, 22, SSH_USER, SSH_PASS, source, destination, streams, verify)
+        if not upload and source and b2.button("Benchmark vs single stream"):
+            with st.spinner("Downloading twice…"):
+                bench = ssh_gemini_manager.benchmark_sftp_download(SSH_IP, 22, SSH_USER, SSH_PASS, source, streams)
+            if isinstance(bench, str):
+                st.error(bench)
+            else:
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Single stream", f"{bench['single_stream_mb_s']} MB/s")
+                m2.metric(f"{bench['streams']} streams", f"{bench['parallel_mb_s']} MB/s")
+                m3.metric("Speed-up", f"{bench['speedup']}×")
+        job = st.session_state.get("sftp_job")
+        if job is not None:
+            bar, info = st.progress(0.0), st.empty()
+            if job.is_running() and st.button("⏹ Cancel transfer"):
+                job.cancel()
+            while True:
+                prog = job.progress()
+                bar.progress(min(prog["fraction"], 1.0))
+                info.caption(f"{prog['files_done']}/{prog['files_total']} files · "
+                             f"{file_manager.get_human_readable_size(prog['bytes_done'])} of "
+                             f"{file_manager.get_human_readable_size(prog['bytes_total'])} · {prog['mb_per_s']} MB/s"
+                             + (f" · {file_manager.get_human_readable_size(prog['resumed_bytes'])} resumed"
+                                if prog["resumed_bytes"] else ""))
+                if not job.is_running():
+                    break
+                time.sleep(0.25)
+            for err in prog["errors"]:
+                st.error(err)
+            if job.results:
+                st.dataframe(job.results_dataframe(), use_container_width=True)
+
+    with tab7:
+        render_remote_file_browser()
 
     if st.session_state.get("cmd"):
         st.markdown("---")
         st.header("Confirm Command Execution")
         st.warning("⚠️  Review carefully before executing!")
         st.code(st.session_state.cmd, language="bash")
+        spill = st.checkbox("Save full output to disk", key="ssh_spill")
         col1, col2 = st.columns([1, 4])
         with col1:
-            if st.button("✅ Yes, Execute", type="primary", use_container_width=True):
-                command = st.session_state.cmd
-                with st.spinner(f"Running `{command}`…"):
-                    output = ssh_gemini_manager.execute_remote_command(SSH_IP, 22, SSH_USER, SSH_PASS, command)
-                    st.session_state.output = output
-                    st.session_state.last_command = command
-                    st.session_state.cmd = None
-                st.rerun()
+            run_clicked = st.button("✅ Yes, Execute", type="primary", use_container_width=True)
         with col2:
             if st.button("❌ No, Cancel", use_container_width=True):
                 st.session_state.cmd = None
                 st.rerun()
+        cached = None
+        if run_clicked and not st.session_state.get("ssh_bypass_cache"):
+            cached = ssh_gemini_manager.RESULT_CACHE.get(SSH_IP, st.session_state.cmd)
+        if cached:
+            st.session_state.output = cached["output"]
+            st.session_state.output_footer = (f"Exit status: {cached['exit_status']} · cached result, "
+                                              f"{ssh_gemini_manager.format_age(cached['age'])} old "
+                                              f"(kept for {ssh_gemini_manager.format_age(cached['ttl'])})")
+            st.session_state.output_cached = True
+            st.session_state.last_command = st.session_state.cmd
+            st.session_state.cmd = None
+            st.rerun()
+        elif run_clicked:
+            command = st.session_state.cmd
+            st.session_state.ssh_bypass_cache = False
+            st.header(f"Output for: `{command}`")
+            st.button("⏹ Stop")  # clicking reruns the script, which closes the channel
+            live = st.empty()
+            stream = ssh_gemini_manager.stream_remote_command(SSH_IP, 22, SSH_USER, SSH_PASS, command, spill)
+            try:
+                last_paint = 0.0
+                for _name, _text in stream:
+                    # Repaint at most ~5x per second so fast output doesn't flood the browser.
+                    if time.time() - last_paint > 0.2:
+                        live.code(stream.buffer.text(), language="bash")
+                        last_paint = time.time()
+                footer = f"Exit status: {stream.exit_status}"
+            except Exception as e:
+                footer = f"An unexpected SSH error occurred: {e}"
+            if stream.spill_path:
+                footer += f" · full output saved to `{stream.spill_path}`"
+            if ssh_gemini_manager.RESULT_CACHE.put(SSH_IP, command, stream.buffer.text(), stream.exit_status):
+                footer += " · fresh result (cached for reuse)"
+            st.session_state.output = stream.buffer.text()
+            st.session_state.output_footer = footer
+            st.session_state.output_cached = False
+            st.session_state.last_command = command
+            st.session_state.cmd = None
+            st.rerun()
 
-    if st.session_state.get("output"):
+    # The last output stays in session state until the next command replaces it, so buttons
+    # rendered with it (like Refresh) still exist on the rerun their click triggers.
+    if st.session_state.get("output") is not None:
         st.markdown("---")
         st.header(f"Output for: `{st.session_state.last_command}`")
         st.code(st.session_state.output, language="bash")
-        st.session_state.output = None
+        st.caption(st.session_state.get("output_footer", ""))
+        if st.session_state.get("output_cached") and st.button("🔄 Refresh from server"):
+            ssh_gemini_manager.RESULT_CACHE.invalidate(SSH_IP, st.session_state.last_command)
+            st.session_state.cmd = st.session_state.last_command
+            st.session_state.ssh_bypass_cache = True
+            st.session_state.output_cached = False
+            st.rerun()
+
+    with st.sidebar.expander("🔌 SSH Connection Pool"):
+        stats = ssh_gemini_manager.SSH_POOL.stats()
+        st.caption(f"{stats['open']} open · {stats['connects']} handshakes · {stats['reuses']} reuses")
+        if stats["hosts"]:
+            st.dataframe(pd.DataFrame(stats["hosts"]), use_container_width=True)
+        if st.button("Close pooled connections"):
+            ssh_gemini_manager.SSH_POOL.close_all()
+            st.rerun()
+        cache_stats = ssh_gemini_manager.RESULT_CACHE.stats()
+        st.caption(f"Result cache: {cache_stats['entries']} entries · {cache_stats['hits']} hits · "
+                   f"{cache_stats['misses']} misses")
+        if st.button("Clear result cache"):
+            ssh_gemini_manager.RESULT_CACHE.invalidate()
+            st.rerun()
+
+def render_remote_file_browser():
+    """File Manager-style browsing of the SSH target over cached SFTP listings."""
+    cache = ssh_gemini_manager.get_remote_directory_cache(SSH_IP, 22, SSH_USER, SSH_PASS)
+    if "rfm_dir" not in st.session_state:
+        try:
+            st.session_state.rfm_dir = cache.home()
+        except Exception as e:
+            st.error(f"An unexpected SSH error occurred: {e}")
+            return
+
+    r1, r2, r3 = st.columns([6, 1, 1])
+    d = r1.text_input("Remote path", st.session_state.rfm_dir)
+    if d != st.session_state.rfm_dir:
+        st.session_state.rfm_dir = d
+    if r2.button("↑ Parent", key="rfm_parent"):
+        st.session_state.rfm_dir = posixpath.dirname(st.session_state.rfm_dir.rstrip("/")) or "/"
+        st.rerun()
+    refresh = r3.button("🔄 Refresh", key="rfm_refresh")
+    cur = st.session_state.rfm_dir
+
+    c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+    q = c1.text_input("Search files/folders", key="rfm_search")
+    sort_by = c2.selectbox("Sort by", file_manager.LISTING_SORT_OPTIONS, key="rfm_sort")
+    page_size = c3.selectbox("Page size", [50, 100, 250, 500], index=1, key="rfm_page_size")
+    descending = c4.checkbox("Descending", key="rfm_desc")
+
+    listing_key = (cur, q, sort_by, descending, page_size)
+    if st.session_state.get("rfm_listing_key") != listing_key:
+        st.session_state.rfm_listing_key = listing_key
+        st.session_state.rfm_page = 0
+    result = ssh_gemini_manager.get_remote_directory_page(cache, cur, st.session_state.rfm_page, page_size,
+                                                          sort_by, descending, q, refresh)
+    if isinstance(result, str):
+        st.error(result)
+        return
+    df, total, n_folders, age = result
+    n_pages = max(1, -(-total // page_size))
+    stats = cache.stats()
+    st.caption(f"{total} items ({n_folders} folders, {total - n_folders} files) · "
+               f"page {st.session_state.rfm_page + 1} of {n_pages} · listing "
+               f"{ssh_gemini_manager.format_age(age)} old · {stats['cached_folders']} folders cached "
+               f"({stats['prefetched']} prefetched)")
+    st.dataframe(df, use_container_width=True)
+    p1, p2, _ = st.columns([1, 1, 6])
+    if p1.button("◀ Prev", key="rfm_prev", disabled=st.session_state.rfm_page == 0):
+        st.session_state.rfm_page -= 1
+        st.rerun()
+    if p2.button("Next ▶", key="rfm_next", disabled=st.session_state.rfm_page >= n_pages - 1):
+        st.session_state.rfm_page += 1
+        st.rerun()
+
+    folders = df[df['Type'] == '📁 Folder']['Name'].tolist()
+    if folders:
+        o1, o2 = st.columns([3, 1])
+        into = o1.selectbox("Open folder", folders, key="rfm_open")
+        if o2.button("Open", key="rfm_open_btn"):
+            st.session_state.rfm_dir = posixpath.join(cur, into)
+            st.rerun()
+
+    files = df[df['Type'] == '📄 File']['Name'].tolist()
+    if files:
+        pv = st.selectbox("Preview file", [""] + files, key="rfm_preview")
+        if pv:
+            path = posixpath.join(cur, pv)
+            mode = st.radio("Preview window", ssh_gemini_manager.REMOTE_PREVIEW_MODES, horizontal=True, key="rfm_mode")
+            offset = st.number_input("Byte offset", min_value=0, value=0, key="rfm_offset") \
+                if mode == "Jump to byte offset" else 0
+            preview = ssh_gemini_manager.preview_remote_file(SSH_IP, 22, SSH_USER, SSH_PASS, path, mode, offset=offset)
+            if isinstance(preview, str):
+                st.error(preview)
+            else:
+                label = "binary (hex dump)" if preview["kind"] == "binary" else preview["encoding"]
+                st.caption(f"{label} · bytes {preview['start']:,}–{preview['end']:,} of "
+                           f"{file_manager.get_human_readable_size(preview['size'])}"
+                           + (" · truncated" if preview["truncated"] else ""))
+                st.code(preview["content"], language=None)
+            target = st.text_input("Download to local folder", os.path.expanduser("~"), key="rfm_target")
+            if st.button("Download via SFTP", key="rfm_download"):
+                st.session_state.sftp_job = ssh_gemini_manager.start_sftp_transfer(
+                    "download", SSH_IP, 22, SSH_USER, SSH_PASS, path, target)
+                st.info("Transfer started; follow its progress on the SFTP tab.")
 
 # ------------------ 5-E  Live AI Camera ------------------
 def render_camera():
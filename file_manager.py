@@ -2,9 +2,36 @@
 # This file contains all the backend logic for the advanced file manager.
 
 import os
+import re
+import sys
+import time
+import mmap
+import errno
+import fnmatch
+import bisect
+import itertools
 import shutil
+import stat
+import select
+import struct
+import ctypes
+import ctypes.util
+import io
+import json
+import uuid
+import hashlib
+import zipfile
+import tempfile
+import mimetypes
+import threading
+import numpy as np
 import pandas as pd
+from datetime import datetime
+from PIL import Image
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
+from shared_state import get_shared, shared_instances
 
 # =================================================================
 # --- Helper and Core Logic Functions ---
@@ -46,6 +73,150 @@ def list_files_as_dataframe(directory):
     except Exception as e:
         return f"An error occurred: {e}"
 
+# =================================================================
+# --- Paginated Directory Listing ---
+# =================================================================
+# Huge folders are listed one page at a time. Entries are streamed straight
+# from os.scandir; a sort index (just the ordered names) is built only when a
+# sorted view is requested and is cached until the folder's mtime changes.
+# Sort indexes and entry counts live in small LRU caches shared by every
+# Streamlit script thread, so all access goes through _LISTING_CACHE_LOCK.
+
+LISTING_SORT_OPTIONS = ["Name", "Size", "Modified", "Directory order"]
+_SORT_INDEX_CACHE = OrderedDict()
+_SORT_INDEX_CACHE_LIMIT = 8
+_ENTRY_COUNTS = OrderedDict()
+_ENTRY_COUNTS_LIMIT = 32
+_LISTING_CACHE_LOCK = threading.Lock()
+
+def _lru_get(cache, key, mtime_ns):
+    """Returns the cached value for `key` if it was stored for this mtime, marking it recently used."""
+    with _LISTING_CACHE_LOCK:
+        cached = cache.get(key)
+        if cached is None or cached[0] != mtime_ns:
+            return None
+        cache.move_to_end(key)
+        return cached[1]
+
+def _lru_put(cache, key, mtime_ns, value, limit):
+    with _LISTING_CACHE_LOCK:
+        cache[key] = (mtime_ns, value)
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+def iter_directory_entries(directory, name_filter=None):
+    """Streams os.DirEntry objects for a folder, optionally filtered by a name substring."""
+    needle = name_filter.lower() if name_filter else None
+    with os.scandir(directory) as it:
+        for entry in it:
+            if needle and needle not in entry.name.lower():
+                continue
+            yield entry
+
+def _is_dir_entry(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _entry_sort_key(entry, sort_by):
+    if sort_by == "Name":
+        return entry.name.lower()
+    try:
+        st = entry.stat()
+    except OSError:
+        return 0
+    return st.st_size if sort_by == "Size" else st.st_mtime
+
+_ENTRY_COUNT_JOBS = {}
+_ENTRY_COUNT_WAIT = 0.05  # small folders are counted before the first paint; big ones finish later
+
+def _count_entries(key, directory, name_filter, mtime_ns):
+    total = folders = 0
+    for entry in iter_directory_entries(directory, name_filter):
+        total += 1
+        folders += _is_dir_entry(entry)
+    _lru_put(_ENTRY_COUNTS, key, mtime_ns, (total, folders), _ENTRY_COUNTS_LIMIT)
+    with _LISTING_CACHE_LOCK:
+        _ENTRY_COUNT_JOBS.pop(key, None)
+
+def _get_entry_counts(directory, name_filter):
+    """Returns (total, folders) for a folder, or (None, None) while a background count is still running."""
+    mtime_ns = os.stat(directory).st_mtime_ns
+    key = (os.path.abspath(directory), name_filter or "")
+    counts = _lru_get(_ENTRY_COUNTS, key, mtime_ns)
+    if counts:
+        return counts
+    with _LISTING_CACHE_LOCK:
+        job = _ENTRY_COUNT_JOBS.get(key)
+        if job is None:
+            job = _ENTRY_COUNT_JOBS[key] = threading.Thread(
+                target=_count_entries, args=(key, directory, name_filter, mtime_ns), daemon=True)
+            job.start()
+    job.join(_ENTRY_COUNT_WAIT)
+    return _lru_get(_ENTRY_COUNTS, key, mtime_ns) or (None, None)
+
+def _entry_row(entry):
+    try:
+        if entry.is_dir():
+            return [entry.name, "📁 Folder", "-"]
+        return [entry.name, "📄 File", get_human_readable_size(entry.stat().st_size)]
+    except OSError:
+        return None
+
+def _get_sort_index(directory, sort_by, descending, name_filter):
+    """Returns (ordered names, folder count) for a folder, reusing the cache while its mtime is unchanged."""
+    mtime_ns = os.stat(directory).st_mtime_ns
+    key = (os.path.abspath(directory), sort_by, descending, name_filter or "")
+    cached = _lru_get(_SORT_INDEX_CACHE, key, mtime_ns)
+    if cached:
+        return cached
+
+    folders, files = [], []
+    for entry in iter_directory_entries(directory, name_filter):
+        bucket = folders if _is_dir_entry(entry) else files
+        bucket.append((_entry_sort_key(entry, sort_by), entry.name))
+    # Folders always come first; the direction applies within each group.
+    folders.sort(reverse=descending)
+    files.sort(reverse=descending)
+    names = [name for _, name in folders] + [name for _, name in files]
+
+    _lru_put(_SORT_INDEX_CACHE, key, mtime_ns, (names, len(folders)), _SORT_INDEX_CACHE_LIMIT)
+    return names, len(folders)
+
+def _listing_row(directory, name):
+    path = os.path.join(directory, name)
+    try:
+        if os.path.isdir(path):
+            return [name, "📁 Folder", "-"]
+        return [name, "📄 File", get_human_readable_size(os.path.getsize(path))]
+    except OSError:
+        return None  # Skip if the item vanished while paging
+
+def get_directory_page(directory, page=0, page_size=100, sort_by="Name", descending=False, name_filter=None):
+    """
+    Returns one page of a folder listing as (DataFrame, total_items, total_folders).
+    Only the entries on the requested page are stat'ed to build the rows. In "Directory order"
+    the page is sliced straight off the scandir stream and the totals are None until counted.
+    """
+    try:
+        if sort_by == "Directory order":
+            start = max(page, 0) * page_size
+            page_entries = itertools.islice(iter_directory_entries(directory, name_filter), start, start + page_size)
+            rows = [row for row in map(_entry_row, page_entries) if row]
+            total, n_folders = _get_entry_counts(directory, name_filter)
+            return pd.DataFrame(rows, columns=["Name", "Type", "Size"]), total, n_folders
+        names, n_folders = _get_sort_index(directory, sort_by, descending, name_filter)
+        start = max(page, 0) * page_size
+        rows = [row for row in (_listing_row(directory, n) for n in names[start:start + page_size]) if row]
+        df = pd.DataFrame(rows, columns=["Name", "Type", "Size"])
+        return df, len(names), n_folders
+    except FileNotFoundError:
+        return "Error: The specified directory does not exist."
+    except Exception as e:
+        return f"An error occurred: {e}"
+
 def rename_item(directory, old_name, new_name):
     """Renames a specified file or folder."""
     old_path = os.path.join(directory, old_name)
@@ -54,6 +225,8 @@ def rename_item(directory, old_name, new_name):
         if not os.path.exists(old_path):
             return "Error: The file or folder to rename does not exist."
         os.rename(old_path, new_path)
+        notify_path_removed(old_path)
+        notify_path_changed(new_path)
         return "Rename successful."
     except Exception as e:
         return f"Error during rename: {e}"
@@ -64,9 +237,11 @@ def delete_item(directory, name):
     try:
         if os.path.isfile(path):
             os.remove(path)
+            notify_path_removed(path)
             return "File deleted successfully."
         elif os.path.isdir(path):
-            shutil.rmtree(path)
+            # Rename into the trash (instant) and let the operation queue purge it.
+            get_file_operation_queue().purge_in_background(move_to_trash(path))
             return "Directory deleted successfully."
         else:
             return "Error: Item not found."
@@ -78,14 +253,2081 @@ def create_directory(directory, folder_name):
     path = os.path.join(directory, folder_name)
     try:
         os.makedirs(path, exist_ok=True)
+        notify_path_changed(path)
         return f"Directory '{folder_name}' created successfully."
     except Exception as e:
         return f"Error creating directory: {e}"
 
 def get_file_content_for_preview(file_path): # <<< RENAMED THIS FUNCTION
-    """Reads and returns the content of a text-based file for previewing."""
+    """Returns a bounded head window of a file for previewing (a hex dump for binary files)."""
+    result = preview_file(file_path)
+    if isinstance(result, str):
+        return result
+    return result["content"]
+
+# =================================================================
+# --- Bounded File Preview ---
+# =================================================================
+# Previews never read the whole file: the file is memory-mapped and only a
+# bounded head/tail/offset window is decoded. A small sample decides between
+# text and binary (hex dump) and sniffs the encoding. Jumping to a line uses a
+# sparse line index of (byte offset, lines before it) checkpoints, built lazily
+# in fixed-size chunks and only as far as the requested line.
+
+PREVIEW_WINDOW_BYTES = 64 * 1024
+PREVIEW_SAMPLE_BYTES = 8 * 1024
+PREVIEW_MODES = ["Head", "Tail", "Head + Tail", "Jump to line", "Jump to byte offset"]
+_LINE_INDEX_CHUNK = 1024 * 1024
+_LINE_INDEX_CACHE = {}
+_LINE_INDEX_CACHE_LIMIT = 16
+_TEXT_BYTES = bytes(range(32, 127)) + b"\n\r\t\f\b\x1b"
+
+def sniff_encoding(sample):
+    """Guesses the text encoding of a byte sample from its BOM or by trial decoding."""
+    if sample.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            return f.read()
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is still UTF-8.
+        if e.start >= len(sample) - 3 and e.reason == "unexpected end of data":
+            return "utf-8"
+    return "cp1252"
+
+def is_binary_sample(sample):
+    """True when a byte sample looks like binary rather than text."""
+    if not sample or sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return False
+    if b"\0" in sample:
+        return True
+    if sniff_encoding(sample) == "utf-8":
+        return False
+    non_text = len(sample.translate(None, _TEXT_BYTES + bytes(range(128, 256))))
+    return non_text / len(sample) > 0.10
+
+def hex_dump(data, base_offset=0, width=16):
+    """Formats bytes as a classic offset / hex / ASCII dump."""
+    lines = []
+    for i in range(0, len(data), width):
+        chunk = data[i:i + width]
+        hex_part = " ".join(f"{b:02x}" for b in chunk)
+        text_part = "".join(chr(b) if 32 <= b < 127 else "." for b in chunk)
+        lines.append(f"{base_offset + i:08x}  {hex_part:<{width * 3}} {text_part}")
+    return "\n".join(lines)
+
+class SparseLineIndex:
+    """
+    Maps line numbers to byte offsets for one file, built lazily.
+    Checkpoints are recorded once per chunk, so building costs one bytes.count per chunk.
+    """
+    def __init__(self):
+        self._offsets = [0]  # byte offset of each checkpoint
+        self._lines = [0]    # number of newlines before that offset
+
+    def _extend(self, mm, line_no=None, offset=None):
+        """Scans further chunks until `line_no` or `offset` is covered (or EOF)."""
+        size = len(mm)
+        while self._offsets[-1] < size:
+            if line_no is not None and self._lines[-1] >= line_no:
+                break
+            if offset is not None and self._offsets[-1] >= offset:
+                break
+            start = self._offsets[-1]
+            end = min(start + _LINE_INDEX_CHUNK, size)
+            self._offsets.append(end)
+            self._lines.append(self._lines[-1] + mm[start:end].count(b"\n"))
+
+    def offset_of_line(self, mm, line_no):
+        """Returns the byte offset where the 0-based `line_no` starts (or EOF if past the end)."""
+        self._extend(mm, line_no=line_no)
+        # Start from the last checkpoint strictly before the target line's newline.
+        i = max(bisect.bisect_left(self._lines, line_no) - 1, 0)
+        pos, remaining = self._offsets[i], line_no - self._lines[i]
+        while remaining > 0:
+            nl = mm.find(b"\n", pos)
+            if nl == -1:
+                return len(mm)
+            pos, remaining = nl + 1, remaining - 1
+        return pos
+
+    def line_of_offset(self, mm, offset):
+        """Returns the 0-based line number containing byte `offset`."""
+        self._extend(mm, offset=offset)
+        i = bisect.bisect_right(self._offsets, offset) - 1
+        return self._lines[i] + mm[self._offsets[i]:offset].count(b"\n")
+
+def _get_line_index(file_path, st):
+    key = (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+    index = _LINE_INDEX_CACHE.get(key)
+    if index is None:
+        if len(_LINE_INDEX_CACHE) >= _LINE_INDEX_CACHE_LIMIT:
+            _LINE_INDEX_CACHE.pop(next(iter(_LINE_INDEX_CACHE)))
+        index = _LINE_INDEX_CACHE[key] = SparseLineIndex()
+    return index
+
+def decode_window(data, start, end, size, encoding, align_lines):
+    """
+    Decodes `data`, the bytes [start, end) of a `size`-byte file, and returns (text, start, end).
+    With `align_lines`, a partial first line (unless at offset 0) and a partial last line
+    (unless at EOF) are dropped and the offsets moved to match.
+    """
+    if align_lines:
+        if start > 0:
+            nl = data.find(b"\n")
+            if 0 <= nl < len(data) - 1:
+                data, start = data[nl + 1:], start + nl + 1
+        if end < size:
+            nl = data.rfind(b"\n")
+            if nl > 0:
+                data, end = data[:nl + 1], start + nl + 1
+    return data.decode(encoding, errors="replace"), start, end
+
+def _decode_window(mm, start, end, encoding, align_lines):
+    """decode_window over mm[start:end], with UTF-16 windows aligned to whole code units."""
+    if encoding == "utf-16":
+        start -= start % 2
+        end -= end % 2
+    return decode_window(mm[start:end], start, end, len(mm), encoding, align_lines)
+
+def preview_file(file_path, mode="Head", window=PREVIEW_WINDOW_BYTES, offset=0, line=0):
+    """
+    Returns a bounded preview of a file as a dict with the rendered content and metadata.
+    `mode` is one of PREVIEW_MODES; at most `window` bytes (twice that for Head + Tail) are read.
+    """
+    try:
+        st = os.stat(file_path)
+        size = st.st_size
+        if size == 0:
+            return {"kind": "text", "content": "", "encoding": "utf-8", "start": 0, "end": 0,
+                    "size": 0, "truncated": False, "line": 0}
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            sample = mm[:PREVIEW_SAMPLE_BYTES]
+            binary = is_binary_sample(sample)
+            encoding = None if binary else sniff_encoding(sample)
+
+            if mode == "Tail":
+                start = max(size - window, 0)
+            elif mode == "Jump to byte offset":
+                start = min(max(int(offset), 0), size - 1)
+            elif mode == "Jump to line" and not binary:
+                start = _get_line_index(file_path, st).offset_of_line(mm, max(int(line), 0))
+            else:
+                start = 0
+            end = min(start + window, size)
+
+            if binary:
+                start -= start % 16
+                content = hex_dump(mm[start:end], start)
+                if mode == "Head + Tail" and end < size:
+                    tail_start = max(end, size - window)
+                    tail_start -= tail_start % 16
+                    content += "\n...\n" + hex_dump(mm[tail_start:size], tail_start)
+                return {"kind": "binary", "content": content, "encoding": None, "start": start,
+                        "end": end, "size": size, "truncated": end - start < size, "line": None}
+
+            content, start, end = _decode_window(mm, start, end, encoding,
+                                                 align_lines=mode in ("Tail", "Head + Tail", "Jump to byte offset"))
+            if mode == "Head + Tail" and end < size:
+                tail, _, _ = _decode_window(mm, max(end, size - window), size, encoding, align_lines=True)
+                content += "\n... [truncated] ...\n" + tail
+            first_line = line if mode == "Jump to line" else None
+            if mode == "Jump to byte offset":
+                first_line = _get_line_index(file_path, st).line_of_offset(mm, start)
+            return {"kind": "text", "content": content, "encoding": encoding, "start": start,
+                    "end": end, "size": size, "truncated": end - start < size, "line": first_line}
+    except Exception as e:
+        return f"Cannot read file: {e}"
+
+# =================================================================
+# --- Streaming Transfers ---
+# =================================================================
+# Uploads and downloads move data in fixed-size chunks so peak memory stays at
+# one chunk regardless of file size. A checksum is computed on the fly, and
+# uploads land in a temp file in the target folder that is renamed into place
+# only once complete, so readers never see a half-written file.
+
+TRANSFER_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_BUFFER_LIMIT = 200 * 1024 * 1024  # larger files are copied out instead of buffered
+CHECKSUM_ALGORITHM = "sha256"
+
+def iter_file_chunks(file_path, chunk_size=TRANSFER_CHUNK_SIZE, hasher=None):
+    """Yields a file's contents chunk by chunk, feeding each chunk to `hasher` if given."""
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if hasher is not None:
+                hasher.update(chunk)
+            yield chunk
+
+def write_chunks_atomically(chunks, dest_path):
+    """
+    Writes an iterable of byte chunks to `dest_path` via temp file + rename.
+    Returns (bytes written, hex checksum).
+    """
+    hasher = hashlib.new(CHECKSUM_ALGORITHM)
+    written = 0
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=dest_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in chunks:
+                hasher.update(chunk)
+                out.write(chunk)
+                written += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        # mkstemp creates 0600 files; keep the replaced file's mode or use a normal default.
+        if os.path.exists(dest_path):
+            shutil.copymode(dest_path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    notify_path_changed(dest_path)
+    return written, hasher.hexdigest()
+
+def save_stream_atomically(source, dest_path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Copies a readable binary file-like object to `dest_path` atomically; returns (bytes, checksum)."""
+    return write_chunks_atomically(iter(lambda: source.read(chunk_size), b""), dest_path)
+
+def save_uploaded_file(uploaded_file, directory, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Streams an uploaded file into `directory` atomically and returns a status message."""
+    try:
+        uploaded_file.seek(0)
+        written, digest = save_stream_atomically(uploaded_file, os.path.join(directory, uploaded_file.name), chunk_size)
+        return f"Uploaded {get_human_readable_size(written)} ({CHECKSUM_ALGORITHM}: {digest[:16]}…)."
+    except Exception as e:
+        return f"Error during upload: {e}"
+
+def copy_file_streaming(src_path, dest_path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Copies a file chunk by chunk (atomically) and returns a status message with its checksum."""
+    try:
+        with open(src_path, "rb") as src:
+            written, digest = save_stream_atomically(src, dest_path, chunk_size)
+        return f"Copied {get_human_readable_size(written)} to {dest_path} ({CHECKSUM_ALGORITHM}: {digest[:16]}…)."
+    except Exception as e:
+        return f"Error during copy: {e}"
+
+def prepare_download(file_path, limit=DOWNLOAD_BUFFER_LIMIT, chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Reads a file for st.download_button if it is no larger than `limit`.
+    Returns (bytes, hex checksum), None when the file is too big to buffer, or an error string.
+    """
+    try:
+        if os.path.getsize(file_path) > limit:
+            return None
+        hasher = hashlib.new(CHECKSUM_ALGORITHM)
+        data = b"".join(iter_file_chunks(file_path, chunk_size, hasher))
+        return data, hasher.hexdigest()
     except Exception as e:
         return f"Cannot read file: {e}"
+
+# =================================================================
+# --- Streaming ZIP Export ---
+# =================================================================
+# A folder is zipped on the fly: zipfile writes into an unseekable in-memory
+# sink (so it emits data descriptors instead of seeking back), and the sink is
+# drained after every chunk. Only one input chunk plus the compressor state is
+# ever held in memory and nothing is staged on disk. Media and archives that
+# are already compressed are stored rather than deflated.
+
+ZIP_STORE_EXTENSIONS = ('.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.jpg', '.jpeg', '.png', '.gif',
+                        '.webp', '.heic', '.mp3', '.mp4', '.m4a', '.aac', '.ogg', '.avi', '.mkv', '.mov',
+                        '.webm', '.pdf', '.docx', '.xlsx', '.pptx', '.parquet')
+
+class _ZipStreamSink(io.RawIOBase):
+    """Write-only, unseekable buffer that hands written bytes back out via drain()."""
+    def __init__(self):
+        self._chunks = deque()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def zip_compress_type(path):
+    """Returns ZIP_STORED for already-compressed formats, ZIP_DEFLATED otherwise."""
+    return zipfile.ZIP_STORED if path.lower().endswith(ZIP_STORE_EXTENSIONS) else zipfile.ZIP_DEFLATED
+
+def stream_zip_folder(directory, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Yields the bytes of a ZIP archive of `directory`, generated incrementally."""
+    directory = os.path.abspath(directory)
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for path, st in walk_files(directory):
+            zinfo = zipfile.ZipInfo.from_file(path, os.path.relpath(path, directory))
+            zinfo.compress_type = zip_compress_type(path)
+            try:
+                with open(path, "rb") as src, zf.open(zinfo, "w", force_zip64=st.st_size >= zipfile.ZIP64_LIMIT) as dst:
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            except OSError:
+                continue  # unreadable file: skip it rather than abort the archive
+            yield sink.drain()
+    yield sink.drain()  # central directory, written on close
+
+def save_zip_folder(directory, dest_path, chunk_size=TRANSFER_CHUNK_SIZE):
+    """Streams a ZIP of `directory` straight to `dest_path` and returns a status message."""
+    try:
+        # The growing temp file would be walked into the archive itself, without end.
+        source, dest_dir = os.path.realpath(directory), os.path.realpath(os.path.dirname(os.path.abspath(dest_path)))
+        if os.path.commonpath([source, dest_dir]) == source:
+            return "Error: Save the archive outside the folder being archived."
+        written, digest = write_chunks_atomically((c for c in stream_zip_folder(directory, chunk_size) if c), dest_path)
+        return f"Saved {get_human_readable_size(written)} archive to {dest_path} ({CHECKSUM_ALGORITHM}: {digest[:16]}…)."
+    except Exception as e:
+        return f"Error creating archive: {e}"
+
+# =================================================================
+# --- Image Thumbnails ---
+# =================================================================
+# Image previews are served from downscaled thumbnails instead of the original.
+# Thumbnails are generated by PIL in a thread pool (decoding and resizing
+# release the GIL) and stored on disk under a key of path + mtime + size, so an
+# edited image gets a fresh thumbnail. The cache is trimmed least-recently-used
+# first once it grows past its byte budget.
+
+THUMBNAIL_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+THUMBNAIL_CACHE_DIR = ".thumbnail_cache"
+
+class ThumbnailCache:
+    """On-disk thumbnail cache with a worker pool for generation and LRU eviction."""
+    def __init__(self, cache_dir=THUMBNAIL_CACHE_DIR, max_size=(320, 320), image_format="JPEG",
+                 max_bytes=200 * 1024 * 1024, max_workers=4):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.image_format = image_format.upper()
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumb")
+        self._evict_lock = threading.Lock()
+        self._bytes = None  # running estimate of the cache size; None until evict() has measured it
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _thumb_path(self, image_path):
+        st = os.stat(image_path)
+        raw = f"{os.path.abspath(image_path)}|{st.st_mtime_ns}|{st.st_size}|{self.max_size}|{self.image_format}"
+        ext = ".webp" if self.image_format == "WEBP" else ".jpg"
+        return os.path.join(self.cache_dir, hashlib.sha1(raw.encode()).hexdigest() + ext)
+
+    def _generate(self, image_path, thumb_path):
+        with Image.open(image_path) as img:
+            # draft() lets the JPEG decoder downscale while decoding, skipping most of the work.
+            img.draft("RGB", self.max_size)
+            img.thumbnail(self.max_size)
+            if img.mode not in ("RGB", "L") and self.image_format == "JPEG":
+                img = img.convert("RGB")
+            tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, self.image_format, quality=80)
+        os.replace(tmp_path, thumb_path)
+
+    def get(self, image_path):
+        """Returns the thumbnail path for an image, generating it on a cache miss; None on failure."""
+        try:
+            thumb_path = self._thumb_path(image_path)
+            if os.path.exists(thumb_path):
+                os.utime(thumb_path)  # mark as recently used
+            else:
+                self._generate(image_path, thumb_path)
+                if self._over_budget(os.path.getsize(thumb_path)):
+                    self.evict()
+            return thumb_path
+        except Exception as e:
+            print(f"Error creating thumbnail for {image_path}: {e}")
+            return None
+
+    def _over_budget(self, added_bytes):
+        with self._evict_lock:
+            if self._bytes is None:
+                return True  # not measured yet
+            self._bytes += added_bytes
+            return self._bytes > self.max_bytes
+
+    def get_many(self, image_paths):
+        """Returns {image path: thumbnail path or None}, generating misses in parallel."""
+        return dict(zip(image_paths, self._pool.map(self.get, image_paths)))
+
+    def evict(self):
+        """Deletes least-recently-used thumbnails until the cache is under 90% of its budget."""
+        with self._evict_lock:
+            entries, total = [], 0
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            removed = 0
+            if total > self.max_bytes:
+                for _mtime, size, path in sorted(entries):
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                        removed += 1
+                    except OSError:
+                        continue
+            self._bytes = total
+            return removed
+
+def get_thumbnail_cache():
+    """Returns the shared ThumbnailCache, creating it on first use."""
+    return get_shared("thumbnail_cache", ThumbnailCache)
+
+def get_thumbnail(image_path):
+    """Returns a cached thumbnail path for one image, or None if it can't be generated."""
+    return get_thumbnail_cache().get(image_path)
+
+def list_image_files(directory):
+    """Returns the names of previewable images in a folder, sorted by name."""
+    try:
+        names = [entry.name for entry in iter_directory_entries(directory)
+                 if entry.name.lower().endswith(THUMBNAIL_EXTENSIONS) and not _is_dir_entry(entry)]
+    except OSError:
+        return []
+    return sorted(names, key=str.lower)
+
+# =================================================================
+# --- Duplicate File Finder ---
+# =================================================================
+# Duplicates are narrowed down in stages so that most files are never read:
+#   1. bucket by size (a first pass keeps only a Counter of sizes, a second pass
+#      keeps paths for sizes seen more than once, so memory tracks candidates);
+#   2. bucket by a partial hash of the first and last block;
+#   3. full-hash only the survivors.
+# Hashing runs in a thread pool over mmap'd files (hashlib releases the GIL).
+
+DUPLICATE_BLOCK_SIZE = 64 * 1024
+_HASH_CHUNK = 8 * 1024 * 1024
+
+def walk_files(root):
+    """Yields (path, stat) for every regular file below `root`, without following symlinks."""
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def _partial_hash(path, size):
+    """Hashes the first and last block; files up to two blocks are hashed whole (and count as settled)."""
+    with open(path, "rb") as f:
+        if size <= 2 * DUPLICATE_BLOCK_SIZE:
+            return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        hasher = hashlib.blake2b(f.read(DUPLICATE_BLOCK_SIZE), digest_size=16)
+        f.seek(-DUPLICATE_BLOCK_SIZE, os.SEEK_END)
+        hasher.update(f.read(DUPLICATE_BLOCK_SIZE))
+    return hasher.hexdigest()
+
+def _full_hash(path, size):
+    hasher = hashlib.blake2b(digest_size=32)
+    if size == 0:
+        return hasher.hexdigest()  # mmap can't map an empty file; all empty files hash alike
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for start in range(0, size, _HASH_CHUNK):
+                hasher.update(view[start:start + _HASH_CHUNK])
+        finally:
+            view.release()
+    return hasher.hexdigest()
+
+def _hash_buckets(pool, buckets, hash_func):
+    """Splits each bucket of (path, size) pairs by hash_func, keeping only groups of 2+."""
+    jobs = [(path, size) for bucket in buckets for path, size in bucket]
+    results = pool.map(lambda job: _safe_hash(hash_func, *job), jobs)
+    grouped = defaultdict(list)
+    for (path, size), digest in zip(jobs, results):
+        if digest is not None:
+            grouped[(size, digest)].append((path, size))
+    return {key: group for key, group in grouped.items() if len(group) > 1}
+
+def _safe_hash(hash_func, path, size):
+    try:
+        return hash_func(path, size)
+    except (OSError, ValueError):
+        return None  # unreadable or vanished mid-scan
+
+def find_duplicate_files(root, min_size=1, max_workers=8):
+    """
+    Finds groups of identical files under `root`.
+    Returns a list of {"size", "hash", "paths", "reclaimable"} dicts, largest savings first.
+    """
+    try:
+        if not os.path.isdir(root):
+            return "Error: The specified directory does not exist."
+        # Pass 1: only a size histogram is kept in memory.
+        size_counts = Counter(st.st_size for _, st in walk_files(root) if st.st_size >= min_size)
+        # Pass 2: keep paths for sizes that can have duplicates; skip extra hard links to one inode.
+        by_size, seen_inodes = defaultdict(list), set()
+        for path, st in walk_files(root):
+            if st.st_size >= min_size and size_counts.get(st.st_size, 0) > 1:
+                inode = (st.st_dev, st.st_ino)
+                if inode not in seen_inodes:
+                    seen_inodes.add(inode)
+                    by_size[st.st_size].append((path, st.st_size))
+        del size_counts, seen_inodes
+        buckets = [bucket for bucket in by_size.values() if len(bucket) > 1]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            partial = _hash_buckets(pool, buckets, _partial_hash)
+            # _partial_hash read files of up to two blocks completely, so their groups are final.
+            settled = {key: group for key, group in partial.items() if key[0] <= 2 * DUPLICATE_BLOCK_SIZE}
+            remaining = [group for key, group in partial.items() if key[0] > 2 * DUPLICATE_BLOCK_SIZE]
+            full = _hash_buckets(pool, remaining, _full_hash)
+
+        groups = []
+        for (size, digest), members in list(settled.items()) + list(full.items()):
+            paths = sorted(path for path, _ in members)
+            groups.append({"size": size, "hash": digest, "paths": paths,
+                           "reclaimable": size * (len(paths) - 1)})
+        groups.sort(key=lambda g: g["reclaimable"], reverse=True)
+        return groups
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+def duplicates_to_dataframe(groups, root=None):
+    """Flattens duplicate groups into one row per file for display."""
+    data = []
+    for group_no, group in enumerate(groups, start=1):
+        for path in group["paths"]:
+            data.append([group_no, os.path.relpath(path, root) if root else path,
+                         get_human_readable_size(group["size"]),
+                         get_human_readable_size(group["reclaimable"])])
+    return pd.DataFrame(data, columns=["Group", "Path", "Size", "Group Reclaimable"])
+
+# =================================================================
+# --- Folder Sizes ---
+# =================================================================
+# A du-style engine. Each directory's own file bytes and subfolder names are
+# cached against its mtime; a directory whose mtime is unchanged is not listed
+# again, only stat'ed. (A directory's mtime moves when entries are added,
+# removed or renamed, not when an existing file grows in place, so such growth
+# only shows up after a refresh, which lists every folder again.) Levels of
+# the tree are listed concurrently in a thread pool and totals are rolled up
+# bottom-up, so one walk yields the size of every folder in the subtree. The
+# cache is an LRU bounded to max_cached_dirs directories.
+
+class FolderSizeEngine:
+    """Parallel recursive folder-size calculator with a per-directory mtime cache."""
+    def __init__(self, max_workers=8, parallel_folders=4, max_cached_dirs=200_000):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="du")
+        self._folder_pool = ThreadPoolExecutor(max_workers=parallel_folders, thread_name_prefix="du-top")
+        self.max_cached_dirs = max_cached_dirs
+        self._cache = OrderedDict()  # dir path -> (mtime_ns, own file bytes, tuple of subfolder names)
+        self._lock = threading.Lock()
+
+    def _scan_dir(self, path, refresh=False):
+        """Returns (own file bytes, subfolder paths) for one directory, from cache when unchanged."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return 0, []
+        with self._lock:
+            cached = None if refresh else self._cache.get(path)
+            if cached and cached[0] == mtime_ns:
+                self._cache.move_to_end(path)
+                return cached[1], [os.path.join(path, name) for name in cached[2]]
+        own, subdirs = 0, []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        else:
+                            own += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            return 0, []
+        with self._lock:
+            self._cache[path] = (mtime_ns, own, tuple(subdirs))
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_cached_dirs:
+                self._cache.popitem(last=False)
+        return own, [os.path.join(path, name) for name in subdirs]
+
+    def compute_tree(self, root, refresh=False):
+        """Returns {folder path: total bytes} for `root` and every folder below it; `refresh` ignores the cache."""
+        root = os.path.abspath(root)
+        own_sizes, children = {}, {}
+        frontier = [root]
+        while frontier:
+            results = list(self._pool.map(lambda path: self._scan_dir(path, refresh), frontier))
+            next_frontier = []
+            for path, (own, subdirs) in zip(frontier, results):
+                own_sizes[path] = own
+                children[path] = subdirs
+                next_frontier.extend(subdirs)
+            frontier = next_frontier
+        totals = {}
+        # Children were discovered after their parents, so reversed order is bottom-up.
+        for path in reversed(list(own_sizes)):
+            totals[path] = own_sizes[path] + sum(totals[c] for c in children[path])
+        return totals
+
+    def folder_size(self, path, refresh=False):
+        """Returns the total size in bytes of one folder."""
+        return self.compute_tree(path, refresh).get(os.path.abspath(path), 0)
+
+    def iter_folder_sizes(self, directory, names, refresh=False):
+        """Yields (name, total bytes) for subfolders of `directory` as each one finishes."""
+        futures = {self._folder_pool.submit(self.folder_size, os.path.join(directory, name), refresh): name
+                   for name in names}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception:
+                yield futures[future], None
+
+    def biggest_folders(self, root, top_n=20, refresh=False):
+        """Returns the `top_n` largest folders below `root` as a DataFrame."""
+        root = os.path.abspath(root)
+        totals = self.compute_tree(root, refresh)
+        totals.pop(root, None)
+        biggest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top_n]
+        data = [[os.path.relpath(path, root), get_human_readable_size(size), size] for path, size in biggest]
+        return pd.DataFrame(data, columns=["Folder", "Size", "Bytes"])
+
+def get_folder_size_engine():
+    """Returns the shared FolderSizeEngine, creating it on first use."""
+    return get_shared("folder_size_engine", FolderSizeEngine)
+
+# =================================================================
+# --- Content Search (grep) ---
+# =================================================================
+# Files under a root are scanned by a thread pool: each worker mmaps a file,
+# skips it if the first block looks binary, and runs a compiled bytes regex
+# straight over the map (the regex engine holds the GIL, but mmap avoids
+# copying each file and the pool overlaps disk I/O). Matches are yielded per file as workers finish,
+# and a threading.Event cancels the walk and all workers.
+
+GREP_IGNORE_GLOBS = [".git", ".svn", ".hg", "node_modules", "__pycache__", ".venv", "venv",
+                     ".thumbnail_cache", ".fm_trash", "*.pyc", "*.so", "*.zip", "*.gz"]
+GREP_MAX_MATCHES_PER_FILE = 200
+
+def _is_ignored(name, ignore_globs):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore_globs)
+
+def iter_search_candidates(root, ignore_globs=GREP_IGNORE_GLOBS, cancel_event=None):
+    """Yields regular files below `root` whose name (and folder names) match no ignore glob."""
+    stack = [root]
+    while stack:
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if _is_ignored(entry.name, ignore_globs):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def compile_search_pattern(pattern, use_regex=True, ignore_case=False):
+    """
+    Compiles a text pattern into a bytes regex, escaping it when `use_regex` is False.
+    MULTILINE makes ^ and $ anchor at every line, as in grep.
+    """
+    raw = pattern.encode("utf-8")
+    return re.compile(raw if use_regex else re.escape(raw), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+
+def _grep_file(path, regex, context, cancel_event):
+    """Returns the matching lines of one file as a list of dicts."""
+    matches = []
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return matches
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if is_binary_sample(mm[:PREVIEW_SAMPLE_BYTES]):
+                    return matches
+                size, pos, line_no, counted_to = len(mm), 0, 1, 0
+                while len(matches) < GREP_MAX_MATCHES_PER_FILE:
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    m = regex.search(mm, pos)
+                    if m is None:
+                        break
+                    line_start = mm.rfind(b"\n", 0, m.start()) + 1
+                    line_end = mm.find(b"\n", m.end())
+                    line_end = size if line_end == -1 else line_end
+                    line_no += mm[counted_to:line_start].count(b"\n")
+                    counted_to = line_start
+                    before_start = line_start
+                    for _ in range(context):
+                        if before_start == 0:
+                            break
+                        before_start = mm.rfind(b"\n", 0, before_start - 1) + 1
+                    after_end = line_end
+                    for _ in range(context):
+                        if after_end >= size:
+                            break
+                        nxt = mm.find(b"\n", after_end + 1)
+                        after_end = size if nxt == -1 else nxt
+                    matches.append({
+                        "path": path,
+                        "line": line_no,
+                        "text": mm[line_start:line_end].decode("utf-8", errors="replace"),
+                        "before": mm[before_start:max(line_start - 1, before_start)].decode("utf-8", errors="replace"),
+                        "after": mm[min(line_end + 1, after_end):after_end].decode("utf-8", errors="replace"),
+                    })
+                    pos = line_end + 1  # one hit per line, like grep
+                    if pos >= size:
+                        break
+    except (OSError, ValueError):
+        pass  # unreadable or vanished mid-scan
+    return matches
+
+def search_file_contents(root, pattern, use_regex=True, ignore_case=False, context=1,
+                         ignore_globs=GREP_IGNORE_GLOBS, max_workers=8, max_results=1000, cancel_event=None):
+    """
+    Searches file contents under `root`, yielding match dicts (path, line, text, before, after)
+    as soon as each file is scanned. Set `cancel_event` to stop the search early.
+    """
+    regex = compile_search_pattern(pattern, use_regex, ignore_case)
+    cancel_event = cancel_event or threading.Event()
+    found = 0
+    pending = set()
+    candidates = iter_search_candidates(root, ignore_globs, cancel_event)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grep") as pool:
+        try:
+            exhausted = False
+            while not cancel_event.is_set():
+                # Keep a bounded number of files in flight so huge trees don't queue up in memory.
+                while not exhausted and len(pending) < max_workers * 4:
+                    path = next(candidates, None)
+                    if path is None:
+                        exhausted = True
+                    else:
+                        pending.add(pool.submit(_grep_file, path, regex, context, cancel_event))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for match in future.result():
+                        yield match
+                        found += 1
+                        if found >= max_results:
+                            cancel_event.set()
+                            break
+                    if cancel_event.is_set():
+                        break
+        finally:
+            # Also runs when the consumer stops iterating (e.g. a Streamlit rerun).
+            cancel_event.set()
+            for future in pending:
+                future.cancel()
+
+def benchmark_content_search(n_files=2000, lines_per_file=400, worker_counts=(1, 4, 8), pattern=r"TODO|FIXME"):
+    """
+    Builds a synthetic source tree in a temp folder and measures search throughput.
+    Returns a DataFrame with MB/s and match counts per worker count.
+    """
+    source_line = "    result = compute_value(alpha, beta, gamma)  # regular line of code\n"
+    marked_line = "    # TODO: revisit this branch when the cache layer lands\n"
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="grep-bench-") as root:
+        total_bytes = 0
+        for i in range(n_files):
+            sub = os.path.join(root, f"pkg{i % 50}")
+            os.makedirs(sub, exist_ok=True)
+            body = "".join(marked_line if j % 97 == 0 else source_line for j in range(lines_per_file))
+            with open(os.path.join(sub, f"module_{i}.py"), "w") as f:
+                f.write(body)
+            total_bytes += len(body)
+        for workers in worker_counts:
+            start = time.perf_counter()
+            hits = sum(1 for _ in search_file_contents(root, pattern, context=0, max_workers=workers,
+                                                       max_results=float("inf")))
+            elapsed = time.perf_counter() - start
+            rows.append([workers, round(elapsed, 3), round(total_bytes / 1e6 / elapsed, 1), hits])
+    return pd.DataFrame(rows, columns=["Workers", "Seconds", "MB/s", "Matches"])
+
+# =================================================================
+# --- Smart Organizer ---
+# =================================================================
+# Organizing is split into a reviewable plan and an execution step. The plan
+# classifies each file by extension, falling back to MIME type and then to
+# magic-byte sniffing, and targets <root>/<Category>/<YYYY-MM>/<name>.
+# Execution writes every planned move to a JSON-lines journal first, then
+# performs same-device moves as a batch of renames and cross-device moves as
+# copy + delete in a thread pool, journaling each completion. An interrupted
+# run can be resumed from the journal or rolled back.
+
+ORGANIZER_CATEGORIES = {
+    "Images": ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp', '.svg', '.tiff', '.heic'),
+    "Videos": ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.webm', '.flv'),
+    "Audio": ('.mp3', '.wav', '.flac', '.aac', '.ogg', '.m4a'),
+    "Documents": ('.pdf', '.doc', '.docx', '.txt', '.md', '.rtf', '.odt', '.ppt', '.pptx'),
+    "Spreadsheets": ('.csv', '.xls', '.xlsx', '.ods', '.tsv'),
+    "Archives": ('.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz'),
+    "Code": ('.py', '.js', '.ts', '.html', '.css', '.java', '.c', '.cpp', '.h', '.json', '.ipynb', '.sh'),
+    "Models & Data": ('.pkl', '.joblib', '.h5', '.pt', '.onnx', '.parquet', '.npy'),
+}
+_EXTENSION_CATEGORY = {ext: cat for cat, exts in ORGANIZER_CATEGORIES.items() for ext in exts}
+_MIME_CATEGORY = {"image": "Images", "video": "Videos", "audio": "Audio", "text": "Documents"}
+_MAGIC_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "Images"), (b"\xff\xd8\xff", "Images"), (b"GIF8", "Images"),
+    (b"%PDF", "Documents"), (b"PK\x03\x04", "Archives"), (b"\x1f\x8b", "Archives"),
+    (b"7z\xbc\xaf\x27\x1c", "Archives"), (b"Rar!", "Archives"), (b"ID3", "Audio"),
+    (b"fLaC", "Audio"), (b"OggS", "Audio"), (b"\x1aE\xdf\xa3", "Videos"),
+]
+ORGANIZE_JOURNAL_NAME = ".organize_journal.jsonl"
+
+def classify_file(path):
+    """Returns (category, reason) for a file using extension, MIME type, then magic bytes."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _EXTENSION_CATEGORY:
+        return _EXTENSION_CATEGORY[ext], f"extension {ext}"
+    mime, _ = mimetypes.guess_type(path)
+    if mime and mime.split("/")[0] in _MIME_CATEGORY:
+        return _MIME_CATEGORY[mime.split("/")[0]], f"MIME {mime}"
+    try:
+        with open(path, "rb") as f:
+            head = f.read(PREVIEW_SAMPLE_BYTES)
+    except OSError:
+        return "Other", "unreadable"
+    for signature, category in _MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return category, "magic bytes"
+    if head[4:8] == b"ftyp":
+        return "Videos", "magic bytes"
+    if head and not is_binary_sample(head):
+        return "Documents", "sniffed as text"
+    return "Other", "unrecognised"
+
+def _unique_destination(dst, taken):
+    base, ext = os.path.splitext(dst)
+    n = 1
+    while dst in taken or os.path.exists(dst):
+        dst = f"{base} ({n}){ext}"
+        n += 1
+    taken.add(dst)
+    return dst
+
+def build_organize_plan(source_dir, target_root=None, by_date=True, recursive=False):
+    """
+    Builds a list of planned moves {"src", "dst", "category", "reason"} for files in `source_dir`.
+    Nothing is moved; review the plan with organize_plan_to_dataframe first.
+    """
+    target_root = os.path.abspath(target_root or source_dir)
+    category_dirs = {os.path.join(target_root, cat) for cat in list(ORGANIZER_CATEGORIES) + ["Other"]}
+    if recursive:
+        files = ((path, st) for path, st in walk_files(source_dir)
+                 if not any(path.startswith(d + os.sep) for d in category_dirs))
+    else:
+        files = ((e.path, e.stat()) for e in iter_directory_entries(source_dir) if e.is_file(follow_symlinks=False))
+    plan, taken = [], set()
+    for path, st in files:
+        name = os.path.basename(path)
+        if name.startswith("."):
+            continue  # hidden files and our own journal stay put
+        category, reason = classify_file(path)
+        parts = [target_root, category]
+        if by_date:
+            parts.append(datetime.fromtimestamp(st.st_mtime).strftime("%Y-%m"))
+        dst = _unique_destination(os.path.join(*parts, name), taken)
+        plan.append({"src": os.path.abspath(path), "dst": dst, "category": category, "reason": reason})
+    return plan
+
+def organize_plan_to_dataframe(plan, root=None):
+    """Formats a move plan for review."""
+    rel = (lambda p: os.path.relpath(p, root)) if root else (lambda p: p)
+    data = [[rel(m["src"]), rel(m["dst"]), m["category"], m["reason"]] for m in plan]
+    return pd.DataFrame(data, columns=["From", "To", "Category", "Classified by"])
+
+class OrganizeJournal:
+    """Append-only JSON-lines record of planned, completed and rolled-back moves."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _append(self, records):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, plan):
+        """Starts a fresh journal containing every planned move and the folders it will create."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        new_dirs = set()
+        for m in plan:
+            parent = os.path.dirname(m["dst"])
+            while parent not in new_dirs and not os.path.exists(parent):
+                new_dirs.add(parent)
+                parent = os.path.dirname(parent)
+        records = [{"op": "plan", "id": i, "src": m["src"], "dst": m["dst"]} for i, m in enumerate(plan)]
+        self._append([{"op": "created_dirs", "dirs": sorted(new_dirs)}] + records)
+
+    def mark(self, op, move_id, **extra):
+        self._append([{"op": op, "id": move_id, **extra}])
+
+    def load(self):
+        """Returns {id: {"src", "dst", "state"}}; state is planned, done, failed, undone or undo_failed."""
+        moves = {}
+        if not os.path.exists(self.path):
+            return moves
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from an interrupted write
+                if record["op"] == "plan":
+                    moves[record["id"]] = {"src": record["src"], "dst": record["dst"], "state": "planned"}
+                elif record.get("id") in moves:
+                    moves[record["id"]]["state"] = record["op"]
+        return moves
+
+    def created_dirs(self):
+        """Returns the folders that did not exist before the journaled run."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding="utf-8") as f:
+            record = json.loads(f.readline() or "{}")
+        return record.get("dirs", []) if record.get("op") == "created_dirs" else []
+
+def _move_file(src, dst, same_device):
+    """
+    Moves one file; a rename when on the same device, else copy + delete. Copies go to a hidden
+    temp file beside `dst` and are renamed into place, so `dst` only ever appears complete.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if same_device:
+        os.rename(src, dst)
+    else:
+        fd, tmp_path = tempfile.mkstemp(prefix=".organize-", suffix=".part", dir=os.path.dirname(dst))
+        os.close(fd)
+        try:
+            shutil.copy2(src, tmp_path)
+            os.replace(tmp_path, dst)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.remove(src)
+    notify_path_removed(src)
+    notify_path_changed(dst)
+
+def _is_finished_copy(src, dst):
+    """True if `dst` looks like a completed copy2 of `src` (same size and timestamp)."""
+    try:
+        a, b = os.stat(src), os.stat(dst)
+    except OSError:
+        return False
+    return a.st_size == b.st_size and abs(a.st_mtime - b.st_mtime) < 2
+
+def _settle_moves(journal, moves, states, done_op, reverse=False):
+    """
+    Marks moves whose journal line was lost to a crash as `done_op`: the destination exists and
+    the source is gone (a finished rename) or is an identical copy (a copy whose delete never ran;
+    the leftover source is removed). Updates `moves` in place.
+    """
+    for move_id, m in moves.items():
+        if m["state"] not in states:
+            continue
+        src, dst = (m["dst"], m["src"]) if reverse else (m["src"], m["dst"])
+        if not os.path.exists(dst):
+            continue
+        if os.path.exists(src):
+            if not _is_finished_copy(src, dst):
+                continue
+            try:
+                os.remove(src)
+            except OSError:
+                continue
+            notify_path_removed(src)
+        journal.mark(done_op, move_id, settled=True)
+        m["state"] = done_op
+
+def _run_moves(journal, moves, done_op, failed_op, max_workers):
+    """Executes {id: (src, dst)} moves, batching renames and parallelising cross-device copies."""
+    renames, copies = [], []
+    for move_id, (src, dst) in moves.items():
+        try:
+            parent = os.path.dirname(dst)
+            os.makedirs(parent, exist_ok=True)
+            same = os.stat(src).st_dev == os.stat(parent).st_dev
+        except OSError as e:
+            journal.mark(failed_op, move_id, error=str(e))
+            continue
+        (renames if same else copies).append((move_id, src, dst, same))
+
+    summary = {"moved": 0, "failed": 0}
+
+    def run(job):
+        move_id, src, dst, same = job
+        try:
+            if os.path.exists(dst):
+                raise FileExistsError(f"{dst} already exists")
+            _move_file(src, dst, same)
+            journal.mark(done_op, move_id)
+            return True
+        except OSError as e:
+            journal.mark(failed_op, move_id, error=str(e))
+            return False
+
+    # Renames are metadata-only, so a single tight batch beats thread overhead.
+    results = [run(job) for job in renames]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="organize") as pool:
+        results.extend(pool.map(run, copies))
+    summary["moved"] = sum(results)
+    summary["failed"] = len(moves) - summary["moved"]
+    return summary
+
+def execute_organize_plan(plan, target_root, max_workers=8):
+    """Journals and executes an approved plan; returns a status message."""
+    try:
+        journal = OrganizeJournal(os.path.join(target_root, ORGANIZE_JOURNAL_NAME))
+        journal.start(plan)
+        summary = _run_moves(journal, {i: (m["src"], m["dst"]) for i, m in enumerate(plan)}, "done", "failed", max_workers)
+        return f"Organized {summary['moved']} files ({summary['failed']} failed)."
+    except Exception as e:
+        return f"Error during organize: {e}"
+
+def get_organize_journal_status(target_root):
+    """Returns a Counter of move states in the journal under `target_root` (empty if none)."""
+    journal = OrganizeJournal(os.path.join(target_root, ORGANIZE_JOURNAL_NAME))
+    return Counter(m["state"] for m in journal.load().values())
+
+def resume_organize(target_root, max_workers=8):
+    """Retries the moves an interrupted or partly failed run left unfinished."""
+    try:
+        journal = OrganizeJournal(os.path.join(target_root, ORGANIZE_JOURNAL_NAME))
+        moves = journal.load()
+        _settle_moves(journal, moves, ("planned", "failed"), "done")
+        pending = {i: (m["src"], m["dst"]) for i, m in moves.items()
+                   if m["state"] in ("planned", "failed") and os.path.exists(m["src"])}
+        summary = _run_moves(journal, pending, "done", "failed", max_workers)
+        return f"Resumed: moved {summary['moved']} files ({summary['failed']} failed)."
+    except Exception as e:
+        return f"Error during resume: {e}"
+
+def rollback_organize(target_root, max_workers=8):
+    """Moves every completed file back to where it came from."""
+    try:
+        journal = OrganizeJournal(os.path.join(target_root, ORGANIZE_JOURNAL_NAME))
+        moves = journal.load()
+        # Moves that finished before a crash are rolled back too; undos that finished are not redone.
+        _settle_moves(journal, moves, ("planned", "failed"), "done")
+        _settle_moves(journal, moves, ("done", "undo_failed"), "undone", reverse=True)
+        done = {i: (m["dst"], m["src"]) for i, m in moves.items()
+                if m["state"] in ("done", "undo_failed") and os.path.exists(m["dst"])}
+        summary = _run_moves(journal, done, "undone", "undo_failed", max_workers)
+        # Remove the category/date folders the run created, deepest first, if now empty.
+        for folder in sorted(journal.created_dirs(), key=len, reverse=True):
+            try:
+                for name in fnmatch.filter(os.listdir(folder), ".organize-*.part"):
+                    os.remove(os.path.join(folder, name))  # copies cut off by a crash
+                os.rmdir(folder)
+            except OSError:
+                continue
+        return f"Rolled back {summary['moved']} files ({summary['failed']} failed)."
+    except Exception as e:
+        return f"Error during rollback: {e}"
+
+# =================================================================
+# --- Storage Analytics ---
+# =================================================================
+# A tree scan collects (path, ext, size, mtime) into columnar arrays and every
+# dashboard view is a vectorized pandas/numpy aggregation over them. Scans are
+# saved as Parquet snapshots (pickle if pyarrow is unavailable) so reopening
+# the dashboard for the same root loads instantly instead of re-walking.
+
+TREE_SNAPSHOT_DIR = ".tree_snapshots"
+SIZE_BUCKET_EDGES = [0, 1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3, np.inf]
+SIZE_BUCKET_LABELS = ["< 1 KB", "1–10 KB", "10–100 KB", "100 KB–1 MB", "1–10 MB", "10–100 MB", "100 MB–1 GB", "> 1 GB"]
+AGE_BUCKET_EDGES = [-np.inf, 1, 7, 30, 182, 365, 3 * 365, np.inf]
+AGE_BUCKET_LABELS = ["< 1 day", "1 day–1 week", "1 week–1 month", "1–6 months", "6–12 months", "1–3 years", "> 3 years"]
+
+def scan_tree_columns(root):
+    """Walks `root` and returns a DataFrame with path, ext, size and mtime columns."""
+    paths, exts, sizes, mtimes = [], [], [], []
+    for path, st in walk_files(root):
+        paths.append(os.path.relpath(path, root))
+        exts.append(os.path.splitext(path)[1].lower() or "(none)")
+        sizes.append(st.st_size)
+        mtimes.append(st.st_mtime)
+    return pd.DataFrame({
+        "path": paths,
+        "ext": pd.Categorical(exts),
+        "size": np.asarray(sizes, dtype=np.int64),
+        "mtime": np.asarray(mtimes, dtype=np.float64),
+    })
+
+def _snapshot_base(root):
+    return os.path.join(TREE_SNAPSHOT_DIR, hashlib.sha1(os.path.abspath(root).encode()).hexdigest())
+
+def save_tree_snapshot(root, df):
+    """Saves a scan as Parquet (or pickle without pyarrow) and returns the snapshot path."""
+    os.makedirs(TREE_SNAPSHOT_DIR, exist_ok=True)
+    base = _snapshot_base(root)
+    try:
+        df.to_parquet(base + ".parquet", index=False)
+        return base + ".parquet"
+    except ImportError:
+        df.to_pickle(base + ".pkl")
+        return base + ".pkl"
+
+def load_tree_snapshot(root):
+    """Returns (DataFrame, snapshot time) for the last saved scan of `root`, or None."""
+    base = _snapshot_base(root)
+    for ext, reader in ((".parquet", pd.read_parquet), (".pkl", pd.read_pickle)):
+        if os.path.exists(base + ext):
+            try:
+                return reader(base + ext), datetime.fromtimestamp(os.path.getmtime(base + ext))
+            except Exception as e:
+                print(f"Error loading snapshot {base + ext}: {e}")
+    return None
+
+def get_tree_scan(root, refresh=False):
+    """Returns (DataFrame, scanned at), reusing the saved snapshot unless `refresh` is set."""
+    if not refresh:
+        snapshot = load_tree_snapshot(root)
+        if snapshot is not None:
+            return snapshot
+    df = scan_tree_columns(root)
+    save_tree_snapshot(root, df)
+    return df, datetime.now()
+
+def tree_extension_summary(df, top_n=15):
+    """Returns file count, total bytes and share of space per extension, biggest first."""
+    summary = df.groupby("ext", observed=True)["size"].agg(files="count", bytes="sum")
+    summary = summary.sort_values("bytes", ascending=False).head(top_n).reset_index()
+    total = df["size"].sum()
+    summary["share"] = summary["bytes"] / total if total else 0.0
+    return summary
+
+def tree_size_histogram(df):
+    """Returns file count and total bytes per size bucket."""
+    buckets = pd.cut(df["size"], SIZE_BUCKET_EDGES, labels=SIZE_BUCKET_LABELS, right=False)
+    return df.groupby(buckets, observed=False)["size"].agg(files="count", bytes="sum").reset_index(names="bucket")
+
+def tree_age_buckets(df, now=None):
+    """Returns file count and total bytes per last-modified age bucket."""
+    now = now if now is not None else time.time()
+    age_days = (now - df["mtime"].to_numpy()) / 86400.0
+    buckets = pd.cut(age_days, AGE_BUCKET_EDGES, labels=AGE_BUCKET_LABELS, right=False)
+    return df.groupby(buckets, observed=False)["size"].agg(files="count", bytes="sum").reset_index(names="age")
+
+def tree_largest_files(df, top_n=20):
+    """Returns the `top_n` largest files with readable sizes and dates."""
+    largest = df.nlargest(top_n, "size").copy()
+    largest["Size"] = largest["size"].map(get_human_readable_size)
+    largest["Modified"] = pd.to_datetime(largest["mtime"], unit="s").dt.strftime("%Y-%m-%d %H:%M")
+    return largest[["path", "ext", "Size", "Modified"]].rename(columns={"path": "Path", "ext": "Ext"})
+
+# =================================================================
+# --- Folder Sync ---
+# =================================================================
+# Two trees are compared folder by folder on size and mtime (optionally
+# confirming mtime-only differences by hash) to get the minimal set of
+# deletes, folder creations and copies that makes the destination match the
+# source. A SyncJob executes that plan in the background: copies run in a
+# thread pool using os.sendfile where available (kernel-side, no userspace
+# buffer), land via temp file + rename, keep the source mtime, and share an
+# optional bandwidth cap.
+
+SYNC_MTIME_TOLERANCE = 2.0  # seconds; FAT and some network filesystems round mtimes
+SYNC_CHUNK_SIZE = 4 * 1024 * 1024
+
+def _entry_kind(mode):
+    if stat.S_ISDIR(mode):
+        return "dir"
+    if stat.S_ISLNK(mode):
+        return "link"
+    return "file" if stat.S_ISREG(mode) else "special"
+
+def _scan_entries(directory):
+    """
+    Returns {name: (kind, size, mtime, link_target)} for one folder, or {} if it doesn't exist.
+    kind is dir, file, link or special (FIFO, socket, device); link_target is set for links only.
+    """
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    kind = _entry_kind(st.st_mode)
+                    target = os.readlink(entry.path) if kind == "link" else None
+                    entries[entry.name] = (kind, st.st_size, st.st_mtime, target)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return entries
+
+def compare_trees(src_root, dst_root, use_hash=False, delete_extra=False, max_workers=8):
+    """
+    Computes the minimal sync plan from `src_root` to `dst_root`.
+    Returns a list of {"action": delete|mkdir|copy|link|skip, "path", "bytes", "reason"} dicts
+    (paths relative). Symlinks are replicated as links and compared by target; special files
+    are reported as "skip" and never opened.
+    """
+    plan, hash_candidates = [], []
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        src_entries = _scan_entries(os.path.join(src_root, rel))
+        dst_entries = _scan_entries(os.path.join(dst_root, rel))
+        for name, (kind, size, mtime, target) in src_entries.items():
+            path = os.path.join(rel, name)
+            existing = dst_entries.get(name)
+            if kind == "special":
+                plan.append({"action": "skip", "path": path, "bytes": 0, "reason": "special file, not synced"})
+                continue
+            if existing is not None and existing[0] != kind:
+                plan.append({"action": "delete", "path": path, "bytes": 0, "reason": "type changed"})
+                existing = None
+            if kind == "dir":
+                if existing is None:
+                    plan.append({"action": "mkdir", "path": path, "bytes": 0, "reason": "new folder"})
+                stack.append(path)
+            elif kind == "link":
+                if existing is None:
+                    plan.append({"action": "link", "path": path, "bytes": 0, "reason": "new symlink"})
+                elif existing[3] != target:
+                    plan.append({"action": "link", "path": path, "bytes": 0, "reason": "link target differs"})
+            elif existing is None:
+                plan.append({"action": "copy", "path": path, "bytes": size, "reason": "new"})
+            elif existing[1] != size:
+                plan.append({"action": "copy", "path": path, "bytes": size, "reason": "size differs"})
+            elif abs(existing[2] - mtime) > SYNC_MTIME_TOLERANCE:
+                if use_hash:
+                    hash_candidates.append((path, size))
+                else:
+                    plan.append({"action": "copy", "path": path, "bytes": size, "reason": "mtime differs"})
+        if delete_extra:
+            for name in dst_entries.keys() - src_entries.keys():
+                plan.append({"action": "delete", "path": os.path.join(rel, name), "bytes": 0,
+                             "reason": "not in source"})
+
+    def differs(job):
+        path, size = job
+        src_hash = _safe_hash(_full_hash, os.path.join(src_root, path), size)
+        return src_hash is None or src_hash != _safe_hash(_full_hash, os.path.join(dst_root, path), size)
+
+    if hash_candidates:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for (path, size), changed in zip(hash_candidates, pool.map(differs, hash_candidates)):
+                if changed:
+                    plan.append({"action": "copy", "path": path, "bytes": size, "reason": "content differs"})
+    return plan
+
+def sync_plan_to_dataframe(plan):
+    """Formats a sync plan for review."""
+    data = [[m["action"], m["path"], get_human_readable_size(m["bytes"]) if m["action"] == "copy" else "-",
+             m["reason"]] for m in plan]
+    return pd.DataFrame(data, columns=["Action", "Path", "Size", "Reason"])
+
+class _RateLimiter:
+    """Token bucket shared by all copy workers; a rate of 0 means unlimited."""
+    def __init__(self, bytes_per_sec):
+        self.rate = bytes_per_sec
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    def throttle(self, nbytes):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._next_free, now)
+            self._next_free = start + nbytes / self.rate
+            delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+def _copy_symlink(src, dst):
+    """Recreates the symlink `src` at `dst` (same target), replacing whatever is there atomically."""
+    tmp_path = os.path.join(os.path.dirname(dst), f".sync-{uuid.uuid4().hex}.lnk")
+    os.symlink(os.readlink(src), tmp_path)
+    try:
+        os.replace(tmp_path, dst)
+    except OSError:
+        os.remove(tmp_path)
+        raise
+    notify_path_changed(dst)
+
+def _open_regular_file(path):
+    """Opens a regular file for reading; a FIFO or device raises instead of blocking in open()."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+    if not stat.S_ISREG(os.fstat(fd).st_mode):
+        os.close(fd)
+        raise OSError(errno.EINVAL, "not a regular file", path)
+    return os.fdopen(fd, "rb")
+
+def _copy_file_fast(src, dst, limiter, on_bytes, cancel_event=None, chunk_size=SYNC_CHUNK_SIZE):
+    """Copies src to dst (temp file + rename), preferring os.sendfile, and keeps src's timestamps."""
+    fin = _open_regular_file(src)
+    fd, tmp_path = tempfile.mkstemp(prefix=".sync-", suffix=".part", dir=os.path.dirname(dst))
+    try:
+        with fin, os.fdopen(fd, "wb") as fout:
+            size = os.fstat(fin.fileno()).st_size
+            offset = 0
+            use_sendfile = hasattr(os, "sendfile")
+            while offset < size:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise InterruptedError("sync cancelled")
+                count = min(chunk_size, size - offset)
+                limiter.throttle(count)
+                if use_sendfile:
+                    try:
+                        sent = os.sendfile(fout.fileno(), fin.fileno(), offset, count)
+                    except OSError:
+                        use_sendfile = False  # e.g. unsupported filesystem: fall back to read/write
+                        fin.seek(offset)
+                        continue
+                else:
+                    data = fin.read(count)
+                    fout.write(data)
+                    sent = len(data)
+                if sent == 0:
+                    break
+                offset += sent
+                on_bytes(sent)
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    notify_path_changed(dst)
+
+class SyncJob:
+    """Runs a sync plan in a background thread and exposes its progress."""
+    def __init__(self, plan, src_root, dst_root, max_workers=4, bytes_per_sec=0):
+        self.plan = plan
+        self.src_root = src_root
+        self.dst_root = dst_root
+        self.max_workers = max_workers
+        self.total_bytes = sum(m["bytes"] for m in plan if m["action"] == "copy")
+        self.bytes_done = 0
+        self.actions_done = 0
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self._limiter = _RateLimiter(bytes_per_sec)
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def _add_bytes(self, n):
+        with self._lock:
+            self.bytes_done += n
+
+    def _finish_action(self, error=None, path=None):
+        with self._lock:
+            self.actions_done += 1
+            if error:
+                self.errors.append(f"{path}: {error}")
+
+    def _copy(self, item):
+        if self._cancel.is_set():
+            return
+        try:
+            _copy_file_fast(os.path.join(self.src_root, item["path"]), os.path.join(self.dst_root, item["path"]),
+                            self._limiter, self._add_bytes, self._cancel)
+            self._finish_action()
+        except Exception as e:
+            self._finish_action(e, item["path"])
+
+    def _run(self):
+        try:
+            os.makedirs(self.dst_root, exist_ok=True)
+            for item in (m for m in self.plan if m["action"] == "delete"):
+                if self._cancel.is_set():
+                    return
+                path = os.path.join(self.dst_root, item["path"])
+                try:
+                    if os.path.isdir(path) and not os.path.islink(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                    notify_path_removed(path)
+                    self._finish_action()
+                except OSError as e:
+                    self._finish_action(e, item["path"])
+            for item in sorted((m for m in self.plan if m["action"] == "mkdir"), key=lambda m: m["path"]):
+                try:
+                    os.makedirs(os.path.join(self.dst_root, item["path"]), exist_ok=True)
+                    self._finish_action()
+                except OSError as e:
+                    self._finish_action(e, item["path"])
+            for item in (m for m in self.plan if m["action"] in ("link", "skip")):
+                if item["action"] == "skip":
+                    self._finish_action("special file, not synced", item["path"])
+                    continue
+                try:
+                    _copy_symlink(os.path.join(self.src_root, item["path"]), os.path.join(self.dst_root, item["path"]))
+                    self._finish_action()
+                except OSError as e:
+                    self._finish_action(e, item["path"])
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sync") as pool:
+                list(pool.map(self._copy, [m for m in self.plan if m["action"] == "copy"]))
+        finally:
+            self.finished_at = time.time()
+
+    def progress(self):
+        """Returns a snapshot of progress counters."""
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {
+            "actions_done": self.actions_done,
+            "actions_total": len(self.plan),
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.total_bytes,
+            "fraction": self.bytes_done / self.total_bytes if self.total_bytes else
+                        (self.actions_done / len(self.plan) if self.plan else 1.0),
+            "mb_per_s": round(self.bytes_done / 1e6 / elapsed, 2) if elapsed else 0.0,
+            "errors": list(self.errors),
+            "cancelled": self._cancel.is_set(),
+        }
+
+def start_sync(src_root, dst_root, use_hash=False, delete_extra=False, max_workers=4, mb_per_sec=0):
+    """Compares the trees and starts a SyncJob for the resulting plan."""
+    plan = compare_trees(src_root, dst_root, use_hash, delete_extra)
+    return SyncJob(plan, src_root, dst_root, max_workers, int(mb_per_sec * 1024 * 1024)).start()
+
+# =================================================================
+# --- Background File Operations ---
+# =================================================================
+# Delete, move and copy over many selected items run as jobs on a module-level
+# queue, so they keep going (and stay visible) across Streamlit reruns. Each
+# job counts items and bytes and can be cancelled between files. Deletes first
+# rename each item into a hidden trash folder on the same filesystem, which is
+# instant, and only then purge the trash in the background.
+
+TRASH_DIR_NAME = ".fm_trash"
+FILE_OPERATIONS = ["Delete", "Move", "Copy"]
+
+def move_to_trash(path):
+    """Renames `path` into a trash folder beside it and returns its new location."""
+    path = os.path.abspath(path)
+    trash_dir = os.path.join(os.path.dirname(path), TRASH_DIR_NAME)
+    os.makedirs(trash_dir, exist_ok=True)
+    trashed = os.path.join(trash_dir, f"{uuid.uuid4().hex}-{os.path.basename(path)}")
+    os.rename(path, trashed)
+    notify_path_removed(path)
+    return trashed
+
+def _path_size(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        return get_folder_size_engine().folder_size(path)
+    try:
+        return os.lstat(path).st_size
+    except OSError:
+        return 0
+
+class FileOperationJob:
+    """A batch delete/move/copy over several items of one folder, with progress counters."""
+    def __init__(self, op, directory, names, destination=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.op = op
+        self.directory = directory
+        self.names = list(names)
+        self.destination = destination
+        self.status = "queued"
+        self.items_done = 0
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def add_bytes(self, n):
+        with self._lock:
+            self.bytes_done += n
+
+    def summary(self):
+        """Returns one display row describing the job."""
+        return {
+            "Job": self.id,
+            "Operation": self.op,
+            "Items": f"{self.items_done}/{len(self.names)}",
+            "Progress": f"{get_human_readable_size(self.bytes_done)} / {get_human_readable_size(self.bytes_total)}",
+            "Status": self.status,
+            "Errors": len(self.errors),
+        }
+
+class FileOperationQueue:
+    """Runs FileOperationJobs on a small worker pool and keeps their history."""
+    def __init__(self, max_workers=2, history=50):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fileop")
+        self._jobs = {}
+        self._history = history
+
+    def submit(self, op, directory, names, destination=None):
+        """Queues an operation on `names` inside `directory` and returns the job."""
+        job = FileOperationJob(op, directory, names, destination)
+        self._jobs[job.id] = job
+        while len(self._jobs) > self._history:
+            oldest = next(iter(self._jobs))
+            if self._jobs[oldest].status in ("queued", "running"):
+                break
+            self._jobs.pop(oldest)
+        self._pool.submit(self._run, job)
+        return job
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job:
+            job.cancel_event.set()
+
+    def list_jobs(self):
+        """Returns jobs newest first."""
+        return list(reversed(self._jobs.values()))
+
+    def purge_in_background(self, trashed_path, job=None):
+        """Deletes an already-trashed item on the worker pool."""
+        self._pool.submit(self._purge, trashed_path, job)
+
+    def _purge(self, trashed_path, job=None):
+        """Removes a trashed item bottom-up, counting freed bytes, then drops an empty trash dir."""
+        try:
+            if os.path.isdir(trashed_path) and not os.path.islink(trashed_path):
+                for root, dirs, files in os.walk(trashed_path, topdown=False):
+                    for name in files:
+                        path = os.path.join(root, name)
+                        size = os.lstat(path).st_size
+                        os.remove(path)
+                        if job:
+                            job.add_bytes(size)
+                    for name in dirs:
+                        full = os.path.join(root, name)
+                        os.unlink(full) if os.path.islink(full) else os.rmdir(full)
+                os.rmdir(trashed_path)
+            else:
+                size = os.lstat(trashed_path).st_size
+                os.remove(trashed_path)
+                if job:
+                    job.add_bytes(size)
+            os.rmdir(os.path.dirname(trashed_path))  # only succeeds once the trash is empty
+        except OSError:
+            pass
+
+    def _copy_tree(self, src, dst, job):
+        """
+        Copies `src` to `dst` entry by entry: folders are recreated, symlinks copied as links and
+        regular files copied with their timestamps. Returns a list of entries that were not copied.
+        """
+        if job.cancel_event.is_set():
+            raise InterruptedError("cancelled")
+        st = os.lstat(src)
+        if stat.S_ISLNK(st.st_mode):
+            _copy_symlink(src, dst)
+            return []
+        if stat.S_ISREG(st.st_mode):
+            _copy_file_fast(src, dst, _RateLimiter(0), job.add_bytes, job.cancel_event)
+            return []
+        if not stat.S_ISDIR(st.st_mode):
+            return [f"{src}: special file, not copied"]
+        problems = []
+        os.makedirs(dst, exist_ok=True)
+        with os.scandir(src) as it:
+            entries = list(it)
+        for entry in entries:
+            try:
+                problems += self._copy_tree(entry.path, os.path.join(dst, entry.name), job)
+            except InterruptedError:
+                raise
+            except OSError as e:
+                problems.append(f"{entry.path}: {e}")
+        shutil.copystat(src, dst)
+        return problems
+
+    def _run_delete(self, job):
+        """Trashes every item up front (instant), then purges; cancelling restores unpurged items."""
+        trashed = []
+        for name in job.names:
+            try:
+                trashed.append((name, move_to_trash(os.path.join(job.directory, name))))
+            except OSError as e:
+                job.errors.append(f"{name}: {e}")
+            job.items_done += 1
+        # Sized only once everything is out of sight, so a big folder never lingers during the walk.
+        job.bytes_total = sum(_path_size(trashed_path) for _name, trashed_path in trashed)
+        for i, (name, trashed_path) in enumerate(trashed):
+            if job.cancel_event.is_set():
+                for restore_name, restore_path in trashed[i:]:
+                    original = os.path.join(job.directory, restore_name)
+                    try:
+                        os.rename(restore_path, original)
+                    except OSError as e:
+                        job.errors.append(f"{restore_name}: could not restore from {restore_path}: {e}")
+                        continue
+                    notify_path_changed(original)
+                    job.items_done -= 1
+                return
+            self._purge(trashed_path, job)
+
+    def _run_item(self, job, name):
+        src = os.path.join(job.directory, name)
+        dst = os.path.join(job.destination, name)
+        if os.path.exists(dst):
+            raise FileExistsError(f"{dst} already exists")
+        if job.op == "Move":
+            try:
+                os.rename(src, dst)  # same filesystem: instant
+                job.add_bytes(_path_size(dst))
+                notify_path_removed(src)
+                notify_path_changed(dst)
+                return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        problems = self._copy_tree(src, dst, job)
+        notify_path_changed(dst)
+        if problems:
+            job.errors.extend(f"{name}: {problem}" for problem in problems)
+            if job.op == "Move":
+                job.errors.append(f"{name}: {len(problems)} entries not copied, source kept")
+            return
+        if job.op == "Move":
+            self._purge(move_to_trash(src))
+
+    def _run(self, job):
+        job.status = "running"
+        try:
+            if job.op == "Delete":
+                self._run_delete(job)
+            else:
+                job.bytes_total = sum(_path_size(os.path.join(job.directory, n)) for n in job.names)
+                os.makedirs(job.destination, exist_ok=True)
+                for name in job.names:
+                    if job.cancel_event.is_set():
+                        break
+                    try:
+                        self._run_item(job, name)
+                    except InterruptedError:
+                        break
+                    except Exception as e:
+                        job.errors.append(f"{name}: {e}")
+                    job.items_done += 1
+        except Exception as e:
+            # Anything raised here would otherwise vanish into the executor future.
+            job.errors.append(f"{job.op} failed: {e}")
+        finally:
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+            else:
+                job.status = "failed" if job.errors else "done"
+            job.finished_at = time.time()
+
+def get_file_operation_queue():
+    """Returns the shared FileOperationQueue, creating it on first use."""
+    return get_shared("file_operation_queue", FileOperationQueue)
+
+# =================================================================
+# --- Live Filename Index ---
+# =================================================================
+# A FileIndex is built once per root with a full walk and then kept fresh
+# incrementally: an inotify watcher (Linux) or a polling loop that compares
+# directory mtimes applies only the entries that changed. File operations in
+# this module write through to every index that covers the touched path.
+
+# inotify constants from <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+                  | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_ONLYDIR)
+_INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+def _load_inotify():
+    """Returns a libc handle exposing inotify, or None when it is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class FileIndex:
+    """
+    In-memory index of every file and folder under a root directory.
+    Entries map an absolute path to (is_dir, size, mtime).
+    """
+    def __init__(self, root, poll_interval=2.0):
+        self.root = os.path.abspath(root)
+        self.poll_interval = poll_interval
+        self._entries = {}
+        self._children = {}    # dir path -> set of child names
+        self._dir_mtimes = {}  # dir path -> st_mtime_ns, used by the polling fallback
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._mode = "idle"
+        self._started_at = None
+        self._events = 0
+        self._lag_total = 0.0
+        self._lag_last = 0.0
+        self._lag_max = 0.0
+        self._build_seconds = 0.0
+
+    # --- Building and querying ---
+    def build(self):
+        """Performs a full walk of the root and replaces the index contents."""
+        start = time.perf_counter()
+        with self._lock:
+            self._entries.clear()
+            self._children.clear()
+            self._dir_mtimes.clear()
+            try:
+                st = os.stat(self.root)
+            except OSError:
+                return
+            self._entries[self.root] = (True, 0, st.st_mtime)
+            self._scan_tree(self.root, st.st_mtime_ns)
+        self._build_seconds = time.perf_counter() - start
+
+    def _scan_tree(self, top, top_mtime_ns=None):
+        """Adds everything below `top` to the index and returns the directories found."""
+        dirs_found = []
+        stack = [(top, top_mtime_ns)]
+        while stack:
+            current, mtime_ns = stack.pop()
+            names = set()
+            try:
+                if mtime_ns is None:
+                    mtime_ns = os.stat(current).st_mtime_ns
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        names.add(entry.name)
+                        if is_dir:
+                            self._entries[entry.path] = (True, 0, st.st_mtime)
+                            stack.append((entry.path, st.st_mtime_ns))
+                        else:
+                            self._entries[entry.path] = (False, st.st_size, st.st_mtime)
+            except OSError:
+                continue
+            self._children[current] = names
+            self._dir_mtimes[current] = mtime_ns
+            dirs_found.append(current)
+        return dirs_found
+
+    def __len__(self):
+        return len(self._entries)
+
+    def search(self, query, limit=500):
+        """Returns up to `limit` indexed items whose name contains `query`, as a DataFrame."""
+        query = query.lower()
+        with self._lock:
+            items = list(self._entries.items())
+        data = []
+        for path, (is_dir, size, _mtime) in items:
+            if query in os.path.basename(path).lower():
+                data.append([os.path.relpath(path, self.root),
+                             "📁 Folder" if is_dir else "📄 File",
+                             "-" if is_dir else get_human_readable_size(size)])
+                if len(data) >= limit:
+                    break
+        return pd.DataFrame(data, columns=["Path", "Type", "Size"])
+
+    # --- Incremental updates ---
+    def covers(self, path):
+        """True when `path` lies inside this index's root."""
+        path = os.path.abspath(path)
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def apply_change(self, path, changed_at=None):
+        """Re-stats a single path and updates the index; returns new directories added."""
+        path = os.path.abspath(path)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            self.remove_path(path, changed_at)
+            return []
+        parent, name = os.path.split(path)
+        new_dirs = []
+        with self._lock:
+            if parent in self._children:
+                self._children[parent].add(name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                known = path in self._children
+                self._entries[path] = (True, 0, st.st_mtime)
+                if not known:
+                    new_dirs = self._scan_tree(path, st.st_mtime_ns)
+            else:
+                self._entries[path] = (False, st.st_size, st.st_mtime)
+        self._record_event(changed_at)
+        return new_dirs
+
+    def remove_path(self, path, changed_at=None):
+        """Drops a path and, if it was a folder, its whole subtree from the index."""
+        path = os.path.abspath(path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            if parent in self._children:
+                self._children[parent].discard(name)
+            stack = [path]
+            while stack:
+                current = stack.pop()
+                self._entries.pop(current, None)
+                self._dir_mtimes.pop(current, None)
+                for child in self._children.pop(current, ()):
+                    stack.append(os.path.join(current, child))
+        self._record_event(changed_at)
+
+    def _rescan_dir(self, directory, mtime_ns):
+        """Diffs one directory's listing against the index and applies the difference."""
+        try:
+            with os.scandir(directory) as it:
+                current = {entry.name for entry in it}
+        except OSError:
+            return
+        changed_at = mtime_ns / 1e9
+        with self._lock:
+            known = set(self._children.get(directory, ()))
+            self._dir_mtimes[directory] = mtime_ns
+        for name in known - current:
+            self.remove_path(os.path.join(directory, name), changed_at)
+        for name in current - known:
+            self.apply_change(os.path.join(directory, name), changed_at)
+        # Directory mtimes only move on create/delete/rename; refresh file stats alongside.
+        for name in current & known:
+            path = os.path.join(directory, name)
+            entry = self._entries.get(path)
+            if entry and not entry[0]:
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if (st.st_size, st.st_mtime) != entry[1:]:
+                    self.apply_change(path, st.st_mtime)
+
+    def poll_once(self):
+        """Checks every known directory's mtime and rescans the ones that changed."""
+        with self._lock:
+            dirs = list(self._dir_mtimes.items())
+        for directory, old_mtime in dirs:
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue  # the parent's rescan will drop it
+            if mtime_ns != old_mtime:
+                self._rescan_dir(directory, mtime_ns)
+
+    # --- Watching ---
+    def start_watching(self):
+        """Starts the background updater (inotify if available, else polling)."""
+        if self._thread and self._thread.is_alive():
+            return
+        if not self._entries:
+            self.build()
+        self._stop.clear()
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._watch_loop, daemon=True)
+        self._thread.start()
+
+    def stop_watching(self):
+        """Stops the background updater."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._mode = "idle"
+
+    def _watch_loop(self):
+        libc = _load_inotify()
+        if libc is None or not self._run_inotify(libc):
+            self._mode = "polling"
+            while not self._stop.wait(self.poll_interval):
+                self.poll_once()
+
+    def _run_inotify(self, libc):
+        """Consumes inotify events until stopped; returns False if inotify can't be used."""
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            return False
+        watches = {}
+
+        def add_watches(dirs):
+            for d in dirs:
+                wd = libc.inotify_add_watch(fd, os.fsencode(d), _IN_WATCH_MASK)
+                if wd < 0:
+                    err = ctypes.get_errno()
+                    if err == errno.ENOSPC:  # out of watches: hand over to polling
+                        return False
+                    continue
+                watches[wd] = d
+            return True
+
+        try:
+            with self._lock:
+                dirs = list(self._children)
+            if not add_watches(dirs):
+                return False
+            self._mode = "inotify"
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    buf = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                received = time.time()
+                offset = 0
+                while offset < len(buf):
+                    wd, mask, _cookie, length = _INOTIFY_EVENT.unpack_from(buf, offset)
+                    raw_name = buf[offset + _INOTIFY_EVENT.size: offset + _INOTIFY_EVENT.size + length]
+                    offset += _INOTIFY_EVENT.size + length
+                    if mask & _IN_Q_OVERFLOW:
+                        self.build()
+                        watches.clear()
+                        with self._lock:
+                            dirs = list(self._children)
+                        if not add_watches(dirs):
+                            return False
+                        continue
+                    if mask & _IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    directory = watches.get(wd)
+                    if directory is None:
+                        continue
+                    name = os.fsdecode(raw_name.rstrip(b"\0"))
+                    path = os.path.join(directory, name) if name else directory
+                    if mask & (_IN_DELETE | _IN_MOVED_FROM | _IN_DELETE_SELF):
+                        self.remove_path(path, received)
+                    else:
+                        new_dirs = self.apply_change(path, received)
+                        if new_dirs and not add_watches(new_dirs):
+                            return False
+            return True
+        finally:
+            os.close(fd)
+
+    # --- Metrics ---
+    def _record_event(self, changed_at):
+        lag = max(0.0, time.time() - changed_at) if changed_at else 0.0
+        self._events += 1
+        self._lag_last = lag
+        self._lag_total += lag
+        self._lag_max = max(self._lag_max, lag)
+
+    def get_metrics(self):
+        """Returns update lag and event throughput counters for this index."""
+        uptime = time.time() - self._started_at if self._started_at else 0.0
+        return {
+            "mode": self._mode,
+            "entries": len(self._entries),
+            "watched_dirs": len(self._dir_mtimes),
+            "full_build_s": round(self._build_seconds, 3),
+            "events_applied": self._events,
+            "events_per_sec": round(self._events / uptime, 2) if uptime else 0.0,
+            "last_lag_ms": round(self._lag_last * 1000, 2),
+            "avg_lag_ms": round(self._lag_total / self._events * 1000, 2) if self._events else 0.0,
+            "max_lag_ms": round(self._lag_max * 1000, 2),
+        }
+
+def _build_file_index(root):
+    index = FileIndex(root)
+    index.build()
+    return index
+
+def get_file_index(root, watch=True):
+    """Returns the index for `root`, building it (and starting its watcher) on first use."""
+    root = os.path.abspath(root)
+    index = get_shared(("file_index", root), lambda: _build_file_index(root))
+    if watch:
+        index.start_watching()
+    return index
+
+def find_file_index(path):
+    """Returns the most specific existing index covering `path`, or None."""
+    matches = [idx for idx in shared_instances("file_index") if idx.covers(path)]
+    return max(matches, key=lambda idx: len(idx.root)) if matches else None
+
+def notify_path_changed(path):
+    """Writes a created or modified path through to every index that covers it."""
+    for index in shared_instances("file_index"):
+        if index.covers(path):
+            index.apply_change(path, time.time())
+
+def notify_path_removed(path):
+    """Writes a removed path through to every index that covers it."""
+    for index in shared_instances("file_index"):
+        if index.covers(path):
+            index.remove_path(path, time.time())
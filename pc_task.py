@@ -2,6 +2,10 @@
 # Contains all the functions and the central command registry for the Desktop Assistant.
 
 import os
+import re
+import sys
+import random
+import threading
 import webbrowser
 import datetime
 import subprocess
@@ -12,19 +16,18 @@ import requests
 import pyttsx3
 import speech_recognition as sr
 import socket
+import numpy as np
+from collections import deque
+from sklearn.feature_extraction.text import TfidfVectorizer
+from shared_state import get_shared
 
 # =================================================================
 # --- Helper Functions ---
 # =================================================================
 
-def speak(text):
-    """Speaks the given text."""
-    try:
-        engine = pyttsx3.init('sapi5')
-        engine.say(text)
-        engine.runAndWait()
-    except Exception as e:
-        print(f"Error in speech: {e}")
+def speak(text, interrupt=None):
+    """Queues text to be spoken by the background speech worker and returns immediately."""
+    return get_speech_worker().say(text, interrupt)
 
 def take_command_from_mic():
     """Listens for a voice command and returns it as text."""
@@ -42,6 +45,101 @@ def take_command_from_mic():
         print("Could not understand audio.")
         return "none"
 
+# =================================================================
+# --- Text-to-Speech Worker ---
+# =================================================================
+# Creating a pyttsx3 engine is slow, and runAndWait blocks until speech ends.
+# One daemon thread owns a single engine for the life of the process and
+# speaks queued utterances in order, so callers never wait. The queue is
+# capped (the oldest utterance is dropped), utterances that waited too long
+# are skipped, and with `interrupt_stale` a new utterance cuts off the one
+# being spoken.
+
+TTS_DRIVERS = {"win32": "sapi5", "darwin": "nsss"}  # everything else uses espeak
+TTS_MAX_QUEUE = 5
+TTS_MAX_AGE = 20  # seconds an utterance may wait before it is no longer worth saying
+
+def tts_driver_name():
+    return TTS_DRIVERS.get(sys.platform, "espeak")
+
+class SpeechWorker:
+    """Speaks queued text on a dedicated thread that owns the only TTS engine."""
+    def __init__(self, driver=None, max_queue=TTS_MAX_QUEUE, max_age=TTS_MAX_AGE, interrupt_stale=False):
+        self.driver = driver or tts_driver_name()
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self.interrupt_stale = interrupt_stale
+        self.error = None
+        self.spoken = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._interrupt = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def say(self, text, interrupt=None):
+        """Queues an utterance; returns False if the engine is unavailable."""
+        if self.error or not text:
+            return False
+        with self._cond:
+            if self.interrupt_stale if interrupt is None else interrupt:
+                self.dropped += len(self._pending)
+                self._pending.clear()
+                self._interrupt.set()
+            while self.max_queue and len(self._pending) >= self.max_queue:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((time.time(), str(text)))
+            self._cond.notify()
+        return True
+
+    def stop(self):
+        """Drops queued utterances and cuts off the current one."""
+        with self._cond:
+            self.dropped += len(self._pending)
+            self._pending.clear()
+        self._interrupt.set()
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _on_word(self, engine):
+        def callback(name, location, length):
+            # engine.stop() is only safe on the engine's own thread, i.e. from its callbacks.
+            if self._interrupt.is_set():
+                engine.stop()
+        return callback
+
+    def _run(self):
+        try:
+            engine = pyttsx3.init(self.driver)
+            engine.connect("started-word", self._on_word(engine))
+        except Exception as e:
+            self.error = f"Error in speech: {e}"
+            print(self.error)
+            return
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                queued_at, text = self._pending.popleft()
+                self._interrupt.clear()
+            if self.max_age and time.time() - queued_at > self.max_age:
+                self.dropped += 1
+                continue
+            try:
+                engine.say(text)
+                engine.runAndWait()
+                self.spoken += 1
+            except Exception as e:
+                print(f"Error in speech: {e}")
+
+def get_speech_worker():
+    """Returns the process-wide speech worker, starting it on first use."""
+    return get_shared("speech_worker", SpeechWorker)
+
 # =================================================================
 # --- Task Functions ---
 # =================================================================
@@ -146,6 +244,9 @@ def lock_pc():
 # To add a new command:
 # 1. Create a function for the task.
 # 2. Add a new entry to this dictionary with a unique key.
+# The phrase index and classifier rebuild when the registry gains, loses or
+# renames a command or a command's phrase count changes. Edits that only
+# reword phrases should go through register_task() or registry_changed().
 
 TASK_REGISTRY = {
     # Applications
@@ -172,6 +273,241 @@ TASK_REGISTRY = {
     "lock_pc": {"phrases": ["lock the pc", "lock screen"], "func": lock_pc, "desc": "Lock the PC", "cat": "System"},
 }
 
+_REGISTRY_VERSION = 0
+
+def registry_changed():
+    """Marks TASK_REGISTRY as edited so the phrase index and classifier are rebuilt on next use."""
+    global _REGISTRY_VERSION
+    _REGISTRY_VERSION += 1
+
+def register_task(key, func, phrases, desc, cat="Custom"):
+    """Adds (or replaces) a command in TASK_REGISTRY."""
+    TASK_REGISTRY[key] = {"phrases": list(phrases), "func": func, "desc": desc, "cat": cat}
+    registry_changed()
+
+def _registry_state():
+    # O(commands), a few microseconds for the built-in registry; catches direct dict edits
+    # that never call registry_changed().
+    return _REGISTRY_VERSION, tuple((key, len(info["phrases"])) for key, info in TASK_REGISTRY.items())
+
+def _build_for_registry(cls):
+    built = cls(TASK_REGISTRY)
+    # Holding the dict itself (not its id) also catches a reloaded module, whose fresh
+    # TASK_REGISTRY and reset version counter would otherwise look unchanged.
+    built.registry = TASK_REGISTRY
+    built.registry_state = _registry_state()
+    return built
+
+def _outdated(built):
+    return built.registry is not TASK_REGISTRY or built.registry_state != _registry_state()
+
+# =================================================================
+# --- Phrase Index ---
+# =================================================================
+# Every registry phrase goes into one Aho-Corasick automaton over words, so a
+# query is scanned once however many phrases exist. When several phrases occur
+# in a query the most specific one wins: most words, then most characters,
+# then the earlier registry entry.
+
+def _tokenize(text):
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+class PhraseIndex:
+    """Aho-Corasick automaton mapping registry phrases to task keys."""
+    def __init__(self, registry):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self.n_phrases = 0
+        for order, (key, info) in enumerate(registry.items()):
+            for phrase in info["phrases"]:
+                words = _tokenize(phrase)
+                if not words:
+                    continue
+                node = 0
+                for word in words:
+                    nxt = self._goto[node].get(word)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[node][word] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append([])
+                    node = nxt
+                # Tuples sort by specificity: more words, more characters, earlier entry.
+                self._out[node].append((len(words), len(phrase), -order, key, phrase))
+                self.n_phrases += 1
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                # A node also reports every phrase that ends at its failure target.
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, query):
+        node = 0
+        for position, word in enumerate(_tokenize(query)):
+            while node and word not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(word, 0)
+            for match in self._out[node]:
+                yield position, match
+
+    def find_all(self, query):
+        """Returns every (task_key, phrase, start word) occurring in the query, in order of appearance."""
+        return [(key, phrase, end - n_words + 1) for end, (n_words, _chars, _order, key, phrase) in self._scan(query)]
+
+    def best_match(self, query):
+        """Returns (task_key, phrase) of the most specific phrase in the query, or None."""
+        best = max((match for _pos, match in self._scan(query)), default=None)
+        return (best[3], best[4]) if best else None
+
+def get_phrase_index():
+    """Returns the phrase index for TASK_REGISTRY, rebuilding it if the registry changed."""
+    return get_shared("phrase_index", lambda: _build_for_registry(PhraseIndex), is_stale=_outdated)
+
+def match_command(query):
+    """Returns (task_key, phrase) for the registry command a query refers to, or None."""
+    return get_phrase_index().best_match(query)
+
+def benchmark_phrase_matching(n_phrases=10000, n_queries=1000, seed=0):
+    """
+    Times the old per-phrase substring loop against the automaton on a synthetic registry.
+    Automaton times include the get_phrase_index() lookup that match_command pays on every query.
+    """
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(2000)]
+    registry = {f"task_{i}": {"phrases": [" ".join(rng.sample(vocab, rng.randint(2, 4)))]} for i in range(n_phrases)}
+    phrases = [info["phrases"][0] for info in registry.values()]
+    queries = [" ".join(rng.sample(vocab, 6)) + " " + rng.choice(phrases) for _ in range(n_queries)]
+
+    started = time.perf_counter()
+    index = PhraseIndex(registry)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive_hits = 0
+    for query in queries:
+        for info in registry.values():
+            if any(phrase in query for phrase in info["phrases"]):
+                naive_hits += 1
+                break
+    naive = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed_hits = sum(index.best_match(query) is not None for query in queries)
+    scan = time.perf_counter() - started
+
+    get_phrase_index()  # built outside the timed loop, as it is after the first query
+    started = time.perf_counter()
+    for _query in queries:
+        get_phrase_index()
+    lookup = time.perf_counter() - started
+    indexed = scan + lookup
+    return {"phrases": index.n_phrases, "queries": n_queries, "build_ms": round(build * 1000, 1),
+            "substring_loop_us_per_query": round(naive / n_queries * 1e6, 1),
+            "automaton_us_per_query": round(indexed / n_queries * 1e6, 1),
+            "index_lookup_us_per_query": round(lookup / n_queries * 1e6, 2),
+            "speedup": round(naive / indexed, 1) if indexed else 0.0,
+            "hits": (naive_hits, indexed_hits)}
+
+# =================================================================
+# --- Fuzzy Intent Classifier ---
+# =================================================================
+# Voice transcripts are often slightly off ("open note pad", "whats the time")
+# and then no phrase matches exactly. Every phrase and description in the
+# registry becomes a TF-IDF vector of character n-grams (taken with spaces
+# removed, so word splits don't matter), stacked into one sparse matrix; a
+# query is scored by cosine similarity against all rows in one product.
+# Shared n-grams alone are not enough: the query must also contain a whole
+# word of the winning task, and the tasks in FUZZY_EXCLUDED_TASKS (shutdown,
+# restart, lock) only ever run from an exact phrase.
+
+FUZZY_MIN_CONFIDENCE = 0.55
+FUZZY_MIN_MARGIN = 0.1  # over the runner-up task, so unrelated speech doesn't trigger a command
+FUZZY_EXCLUDED_TASKS = {"shutdown_pc", "restart_pc", "lock_pc"}  # add new power tasks (e.g. sleep) here
+_FUZZY_FILLER_WORDS = {"a", "an", "the", "is", "me", "my", "of", "to", "in", "on", "for", "what", "tell"}
+
+def _squash(text):
+    return "".join(_tokenize(text))
+
+class IntentClassifier:
+    """Char n-gram TF-IDF nearest-neighbour classifier over registry phrases."""
+    def __init__(self, registry, ngram_range=(2, 4)):
+        self.labels = []
+        examples = []
+        self._task_words = {}
+        self._excluded = FUZZY_EXCLUDED_TASKS & set(registry)
+        for key, info in registry.items():
+            for example in list(info["phrases"]) + ([info["desc"]] if info.get("desc") else []):
+                self.labels.append(key)
+                examples.append(example)
+                self._task_words.setdefault(key, set()).update(_tokenize(example))
+        for words in self._task_words.values():
+            words -= _FUZZY_FILLER_WORDS
+        self._vectorizer = TfidfVectorizer(analyzer="char", ngram_range=ngram_range, preprocessor=_squash,
+                                           sublinear_tf=True, dtype=np.float32)
+        self._analyze = self._vectorizer.build_analyzer()
+        # Rows are L2-normalised, so a dot product with a normalised query is the cosine similarity.
+        self._matrix_t = self._vectorizer.fit_transform(examples).T.tocsr()
+        self._vocab = self._vectorizer.vocabulary_
+        self._idf = self._vectorizer.idf_
+
+    def _query_vector(self, query):
+        """Builds the normalised query vector directly (skips the vectorizer's per-call validation)."""
+        counts = {}
+        for gram in self._analyze(query):
+            col = self._vocab.get(gram)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return None, None
+        cols = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self._idf[cols]
+        return cols, weights / np.linalg.norm(weights)
+
+    def scores(self, query, top_k=3):
+        """Returns up to `top_k` (task_key, confidence) pairs, best first, one per task."""
+        cols, weights = self._query_vector(query)
+        if cols is None:
+            return []
+        sims = self._matrix_t[cols].T @ weights
+        ranked = []
+        for row in np.argsort(-sims):
+            key = self.labels[row]
+            if all(key != k for k, _ in ranked):
+                ranked.append((key, round(float(sims[row]), 3)))
+                if len(ranked) == top_k:
+                    break
+        return ranked
+
+    def classify(self, query, min_confidence=FUZZY_MIN_CONFIDENCE, min_margin=FUZZY_MIN_MARGIN):
+        """
+        Returns (task_key, confidence) for a clear best task, else None.
+        Excluded tasks and tasks sharing no whole word with the query are never returned.
+        """
+        ranked = self.scores(query, top_k=2)
+        if not ranked or ranked[0][1] < min_confidence:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < min_margin:
+            return None
+        key = ranked[0][0]
+        if key in self._excluded or not self._task_words[key] & set(_tokenize(query)):
+            return None
+        return ranked[0]
+
+def get_intent_classifier():
+    """Returns the classifier for TASK_REGISTRY, rebuilding it if the registry changed."""
+    return get_shared("intent_classifier", lambda: _build_for_registry(IntentClassifier), is_stale=_outdated)
+
 # =================================================================
 # --- Command Executor ---
 # =================================================================
@@ -188,12 +524,12 @@ def execute_command(query):
         except Exception as e:
             return f"Sorry, I could not find anything on Wikipedia about {search_term}. Error: {e}"
 
-    # Check for direct phrase matches in the registry
-    for task_key, task_info in TASK_REGISTRY.items():
-        for phrase in task_info["phrases"]:
-            if phrase in query:
-                result = task_info["func"]()
-                speak(result) # Speak the result
-                return result
+    # One pass over the query finds the most specific registry phrase;
+    # misheard phrasings fall back to the fuzzy classifier.
+    match = match_command(query) or get_intent_classifier().classify(query)
+    if match and match[0] in TASK_REGISTRY:
+        result = TASK_REGISTRY[match[0]]["func"]()
+        speak(result) # Speak the result
+        return result
 
     return "Sorry, I don't know that command."
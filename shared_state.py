@@ -0,0 +1,34 @@
+# File Name: shared_state.py
+# Process-wide objects (worker queues, caches, pools, pollers) shared by every Streamlit rerun.
+#
+# Streamlit re-executes app.py on each interaction, but imported modules are
+# loaded once per process, so objects registered here outlive the rerun that
+# created them. Each object is created lazily under its own lock: building a
+# slow one (e.g. a file index) never blocks lookups of the others.
+
+import threading
+
+_INSTANCES = {}
+_KEY_LOCKS = {}
+_LOCK = threading.Lock()
+
+def get_shared(key, factory, is_stale=None):
+    """
+    Returns the process-wide object stored under `key`, creating it with `factory()` on first use.
+    If `is_stale(obj)` returns True the object is replaced with a fresh one.
+    Keys are strings or tuples whose first item names the kind of object, e.g. ("file_index", root).
+    """
+    instance = _INSTANCES.get(key)
+    if instance is not None and not (is_stale and is_stale(instance)):
+        return instance
+    with _LOCK:
+        key_lock = _KEY_LOCKS.setdefault(key, threading.Lock())
+    with key_lock:
+        instance = _INSTANCES.get(key)
+        if instance is None or (is_stale and is_stale(instance)):
+            instance = _INSTANCES[key] = factory()
+        return instance
+
+def shared_instances(kind):
+    """Returns every object whose tuple key starts with `kind`."""
+    return [obj for key, obj in list(_INSTANCES.items()) if isinstance(key, tuple) and key[0] == kind]
@@ -1,8 +1,30 @@
 # File Name: ssh_gemini_manager.py
 # This module handles Gemini AI integration and SSH execution.
 
+import os
+import re
+import json
+import math
+import difflib
+import stat
+import time
+import shlex
+import codecs
+import select
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import posixpath
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 import google.generativeai as genai
 import paramiko
+import pandas as pd
+import file_manager
+from shared_state import get_shared
 
 def configure_gemini(api_key):
     """Configures the Gemini API."""
@@ -33,27 +55,1484 @@ def get_linux_command_from_gemini(model, prompt):
     except Exception as e:
         return f"Error generating command: {e}"
 
+# =================================================================
+# --- Local Intent Matcher ---
+# =================================================================
+# Many requests ("show disk usage") are just COMMAND_MENU entries in other
+# words. Menu descriptions are indexed once as TF-IDF vectors over word tokens
+# plus character trigrams (which tolerate typos and word forms), held in an
+# inverted index so a query touches only entries sharing a feature. Confident
+# matches are answered locally; everything else goes to Gemini, whose answers
+# are cached by normalized prompt. "Confident" is deliberately strict: every
+# content word of the request must appear in the description (allowing for
+# typos), and requests carrying arguments the menu entry lacks (paths,
+# numbers, flags, names) always go to Gemini.
+
+_STOP_WORDS = {"a", "an", "the", "me", "my", "please", "can", "you", "i", "want", "to", "of", "on",
+               "for", "and", "is", "what", "whats", "all", "this", "that", "how", "do", "give", "let"}
+
+# Verbs that only ask to see something; they don't have to appear in the description.
+_GENERIC_VERBS = {"show", "display", "list", "get", "print", "view", "see", "tell", "check"}
+_ARGUMENT_TOKEN = re.compile(r"[/~\\\d=:@*'\"]|^-|\w\.\w")
+
+def normalize_prompt(prompt):
+    """Lowercases a prompt and strips punctuation and extra whitespace (used for matching)."""
+    return " ".join(re.findall(r"[a-z0-9]+", prompt.lower()))
+
+def prompt_cache_key(prompt):
+    """
+    Cache key for a generated command: plain words are lowercased and stripped of sentence
+    punctuation, but paths, names, flags, numbers and mixed-case words are kept verbatim,
+    since "/srv/a-b" and "/srv/a/b" (or README and readme) need different commands.
+    """
+    parts = []
+    for i, token in enumerate(prompt.split()):
+        word = token.rstrip("?!,;:")
+        if word.endswith(".") and word[:-1].isalpha():
+            word = word[:-1]
+        if word.isalpha() and (word.islower() or (i == 0 and word.istitle())):
+            word = word.lower()
+        parts.append(word)
+    return " ".join(parts)
+
+def _intent_features(text):
+    words = [w for w in normalize_prompt(text).split() if w not in _STOP_WORDS]
+    features = Counter(f"w:{w}" for w in words)
+    for word in words:
+        padded = f" {word} "
+        features.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+def _word_covered(word, desc_words):
+    """True if a request word appears in a description, allowing word forms and small typos."""
+    if word in desc_words:
+        return True
+    for d in desc_words:
+        if len(word) >= 3 and len(d) >= 3 and (d.startswith(word) or word.startswith(d)):
+            return True  # info / information, process / processes
+        if len(word) >= 4 and difflib.SequenceMatcher(None, word, d).ratio() >= 0.8:
+            return True  # devics / devices
+    return False
+
+def _unmatched_request_parts(prompt, description):
+    """Returns the request's arguments and content words that the description doesn't account for."""
+    desc_words = set(normalize_prompt(description).split())
+    leftovers = []
+    for token in prompt.split():
+        words = normalize_prompt(token).split()
+        if _ARGUMENT_TOKEN.search(token) and not all(w in desc_words for w in words):
+            leftovers.append(token)  # a path, number, flag or name the menu command can't carry
+            continue
+        leftovers.extend(w for w in words if w not in _STOP_WORDS and w not in _GENERIC_VERBS
+                         and not _word_covered(w, desc_words))
+    return leftovers
+
+class CommandIntentMatcher:
+    """TF-IDF nearest-neighbour matcher from natural-language requests to COMMAND_MENU entries."""
+    def __init__(self, command_menu, threshold=0.7, margin=0.05):
+        self.threshold = threshold
+        self.margin = margin
+        self.entries = [(desc, cmd, cat) for cat, cmds in command_menu.items() for desc, cmd in cmds.items()]
+        doc_features = [_intent_features(desc) for desc, _cmd, _cat in self.entries]
+        doc_freq = Counter(f for feats in doc_features for f in feats)
+        n_docs = len(self.entries)
+        self._idf = {f: math.log((1 + n_docs) / (1 + df)) + 1.0 for f, df in doc_freq.items()}
+        self._unknown_idf = math.log(1 + n_docs) + 1.0  # as rare as a feature can be
+        self._postings = {}
+        for doc_id, feats in enumerate(doc_features):
+            vector = self._weigh(feats, keep_unknown=False)
+            for feature, weight in vector.items():
+                self._postings.setdefault(feature, []).append((doc_id, weight))
+
+    def _weigh(self, features, keep_unknown=True):
+        """
+        Turns feature counts into an L2-normalised TF-IDF vector. Features no description has
+        stay in the norm at the highest idf, so words the menu can't explain lower the score.
+        """
+        vector = {f: (1 + math.log(tf)) * self._idf.get(f, self._unknown_idf) for f, tf in features.items()
+                  if keep_unknown or f in self._idf}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {f: v / norm for f, v in vector.items()} if norm else {}
+
+    def match(self, prompt, top_k=3):
+        """Returns up to `top_k` (score, description, command) tuples, best first."""
+        scores = Counter()
+        for feature, q_weight in self._weigh(_intent_features(prompt)).items():
+            for doc_id, d_weight in self._postings.get(feature, ()):
+                scores[doc_id] += q_weight * d_weight
+        return [(round(score, 3), self.entries[i][0], self.entries[i][1]) for i, score in scores.most_common(top_k)]
+
+    def best(self, prompt):
+        """Returns (score, description, command) for a confident match, else None."""
+        ranked = self.match(prompt, top_k=2)
+        if not ranked or ranked[0][0] < self.threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < self.margin and ranked[0][2] != ranked[1][2]:
+            return None  # two entries are about equally likely: let Gemini decide
+        if _unmatched_request_parts(prompt, ranked[0][1]):
+            return None  # the request asks for more than the menu entry does
+        return ranked[0]
+
+class CommandResolver:
+    """Answers from the local matcher, then the prompt cache, and only then Gemini."""
+    def __init__(self, command_menu, cache_size=256):
+        self.menu = {cat: dict(cmds) for cat, cmds in command_menu.items()}
+        self.matcher = CommandIntentMatcher(command_menu)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.counts = Counter()
+
+    def resolve(self, model, prompt):
+        """Returns (command, source, detail) where source is "menu", "cache" or "gemini"."""
+        started = time.perf_counter()
+        hit = self.matcher.best(prompt)
+        if hit:
+            self.counts["menu"] += 1
+            score, desc, command = hit
+            return command, "menu", f"matched '{desc}' (score {score}, {(time.perf_counter() - started) * 1000:.2f} ms)"
+        key = prompt_cache_key(prompt)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.counts["cache"] += 1
+            return self._cache[key], "cache", "previously generated by Gemini"
+        self.counts["gemini"] += 1
+        command = get_linux_command_from_gemini(model, prompt)
+        if not command.startswith("Error generating command"):
+            self._cache[key] = command
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return command, "gemini", "generated by Gemini"
+
+    def stats(self):
+        """Returns request counts per source and the share of LLM calls avoided."""
+        total = sum(self.counts.values())
+        avoided = self.counts["menu"] + self.counts["cache"]
+        return {"requests": total, "menu_hits": self.counts["menu"], "cache_hits": self.counts["cache"],
+                "gemini_calls": self.counts["gemini"], "llm_calls_avoided_pct": round(100 * avoided / total, 1) if total else 0.0}
+
+def get_command_resolver(command_menu):
+    """Returns the shared resolver, rebuilding it if the menu changed."""
+    return get_shared("command_resolver", lambda: CommandResolver(command_menu),
+                      is_stale=lambda resolver: resolver.menu != command_menu)
+
+# =================================================================
+# --- Pooled SSH Connections ---
+# =================================================================
+# Connecting costs a TCP handshake, key exchange and authentication. The pool
+# keeps one authenticated transport per (host, port, user) alive with
+# keepalives, so each command only has to open a channel on it. Transports
+# are health-checked before reuse, closed after sitting idle, and a semaphore
+# caps how many channels run on one host at a time.
+
+def _credential_fingerprint(password):
+    return hashlib.sha256((password or "").encode()).hexdigest()
+
+class _PooledConnection:
+    def __init__(self, client, max_sessions, fingerprint):
+        self.client = client
+        self.fingerprint = fingerprint
+        self.transport = client.get_transport()
+        self.last_used = time.time()
+        self.sessions = threading.BoundedSemaphore(max_sessions)
+        self.active_sessions = 0  # slots held right now; the reaper never closes a connection in use
+        self.commands_run = 0
+
+    def is_healthy(self):
+        """True when the transport is up, authenticated and answers a no-op packet."""
+        if self.transport is None or not self.transport.is_active() or not self.transport.is_authenticated():
+            return False
+        try:
+            self.transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+class SSHConnectionPool:
+    """Reusable authenticated SSH transports keyed by (host, port, username)."""
+    def __init__(self, keepalive=30, idle_timeout=300, max_sessions_per_host=4, connect_timeout=10):
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.max_sessions_per_host = max_sessions_per_host
+        self.connect_timeout = connect_timeout
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._reaper = None
+        self.connects = 0
+        self.reuses = 0
+
+    def _connect(self, host, port, username, password):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=host, port=port, username=username, password=password,
+                       timeout=self.connect_timeout, banner_timeout=self.connect_timeout,
+                       auth_timeout=self.connect_timeout)
+        client.get_transport().set_keepalive(self.keepalive)
+        self.connects += 1
+        return _PooledConnection(client, self.max_sessions_per_host, _credential_fingerprint(password))
+
+    def _get(self, host, port, username, password):
+        """Returns a healthy pooled connection, reconnecting if the cached one went bad."""
+        key = (host, port, username)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Per-key lock: concurrent callers for one host share a single handshake.
+        with key_lock:
+            conn = self._connections.get(key)
+            # A different password must authenticate afresh rather than ride an existing login.
+            if conn is not None and conn.fingerprint == _credential_fingerprint(password) and conn.is_healthy():
+                self.reuses += 1
+            else:
+                if conn is not None:
+                    conn.client.close()
+                    with self._lock:
+                        self._connections.pop(key, None)
+                conn = self._connect(host, port, username, password)
+                with self._lock:
+                    self._connections[key] = conn
+                self._start_reaper()
+            conn.last_used = time.time()
+            return conn
+
+    def get_transport(self, host, port, username, password):
+        """Returns the pooled paramiko Transport for a host (e.g. for SFTP)."""
+        return self._get(host, port, username, password).transport
+
+    @contextmanager
+    def _slot(self, host, port, username, password, timeout=None):
+        """Yields a pooled connection while holding one of its per-host session slots."""
+        conn = self._get(host, port, username, password)
+        if not conn.sessions.acquire(timeout=timeout or self.connect_timeout):
+            raise TimeoutError(f"Too many concurrent sessions on {host}")
+        with self._lock:
+            conn.active_sessions += 1
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                conn.active_sessions -= 1
+                conn.last_used = time.time()
+            conn.sessions.release()
+
+    @contextmanager
+    def session(self, host, port, username, password, timeout=None):
+        """Yields a fresh channel on the pooled transport, within the per-host session limit."""
+        with self._slot(host, port, username, password, timeout) as conn:
+            channel = conn.transport.open_session(timeout=timeout or self.connect_timeout)
+            conn.commands_run += 1
+            try:
+                yield channel
+            finally:
+                channel.close()
+
+    @contextmanager
+    def sftp(self, host, port, username, password, timeout=None):
+        """Yields an SFTP client on its own channel of the pooled transport (counts as one session)."""
+        with self._slot(host, port, username, password, timeout) as conn:
+            client = paramiko.SFTPClient.from_transport(conn.transport)
+            try:
+                yield client
+            finally:
+                client.close()
+
+    def run(self, host, port, username, password, command, timeout=None):
+        """Runs one command on a pooled connection and returns (exit status, stdout, stderr)."""
+        with self.session(host, port, username, password, timeout) as channel:
+            if timeout:
+                channel.settimeout(timeout)
+            channel.exec_command(command)
+            stdout = channel.makefile("rb").read().decode(errors="replace")
+            stderr = channel.makefile_stderr("rb").read().decode(errors="replace")
+            return channel.recv_exit_status(), stdout, stderr
+
+    def close_idle(self):
+        """Closes transports with no open session that have been idle longer than idle_timeout; returns how many."""
+        now = time.time()
+        with self._lock:
+            idle = [key for key, conn in self._connections.items()
+                    if conn.active_sessions == 0 and now - conn.last_used > self.idle_timeout]
+            closed = [self._connections.pop(key) for key in idle]
+        for conn in closed:
+            conn.client.close()
+        return len(closed)
+
+    def close_all(self):
+        with self._lock:
+            conns = list(self._connections.values())
+            self._connections.clear()
+        for conn in conns:
+            conn.client.close()
+
+    def _start_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 4, 1))
+            self.close_idle()
+            with self._lock:
+                if not self._connections:
+                    return
+
+    def stats(self):
+        """Returns pool counters and per-host connection details."""
+        now = time.time()
+        with self._lock:
+            hosts = [{"host": f"{user}@{host}:{port}", "commands": conn.commands_run,
+                      "sessions": conn.active_sessions, "idle_s": round(now - conn.last_used, 1),
+                      "active": conn.transport.is_active()}
+                     for (host, port, user), conn in self._connections.items()]
+        return {"connects": self.connects, "reuses": self.reuses, "open": len(hosts), "hosts": hosts}
+
+SSH_POOL = get_shared("ssh_pool", SSHConnectionPool)
+
 def execute_remote_command(host, port, username, password, command):
     """
-    Connects to a remote server via SSH and executes a given command.
+    Runs a command on a remote server over a pooled SSH connection.
     Returns the command's output or an error message.
     """
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    
     try:
-        ssh.connect(hostname=host, port=port, username=username, password=password, timeout=10)
-        stdin, stdout, stderr = ssh.exec_command(command)
-        
-        output = stdout.read().decode()
-        error = stderr.read().decode()
-        
+        _status, output, error = SSH_POOL.run(host, port, username, password, command)
         # Return output if available, otherwise the error
         return output if output else error
-            
     except paramiko.AuthenticationException:
         return "SSH Authentication Error: Please check your username and password in my_secrets.py."
     except Exception as e:
         return f"An unexpected SSH error occurred: {e}"
+
+# =================================================================
+# --- Streaming Command Output ---
+# =================================================================
+# Long-running commands are read as their output arrives instead of waiting
+# for EOF. Chunks are yielded interleaved as ("stdout" | "stderr", text); a
+# bounded ring buffer keeps only the most recent output for display, and the
+# complete raw output can optionally be spilled to a file on disk.
+
+STREAM_CHUNK_SIZE = 32 * 1024
+STREAM_BUFFER_CHARS = 256 * 1024
+SSH_LOG_DIR = "ssh_logs"
+
+class OutputRingBuffer:
+    """Keeps the most recent `max_chars` of decoded output, counting what was dropped."""
+    def __init__(self, max_chars=STREAM_BUFFER_CHARS):
+        self.max_chars = max_chars
+        self._chunks = deque()
+        self._size = 0
+        self.dropped = 0
+
+    def append(self, text):
+        self._chunks.append(text)
+        self._size += len(text)
+        while self._size > self.max_chars and len(self._chunks) > 1:
+            old = self._chunks.popleft()
+            self._size -= len(old)
+            self.dropped += len(old)
+        if self._size > self.max_chars:  # a single oversized chunk: keep its tail
+            text = self._chunks[0]
+            cut = self._size - self.max_chars
+            self._chunks[0] = text[cut:]
+            self._size -= cut
+            self.dropped += cut
+
+    def text(self):
+        head = f"[… {self.dropped:,} earlier characters not shown …]\n" if self.dropped else ""
+        return head + "".join(self._chunks)
+
+class RemoteCommandStream:
+    """
+    Iterates over a remote command's output as it is produced.
+    After iteration, `exit_status` is set (None if cancelled) and `buffer` holds the recent output.
+    """
+    def __init__(self, host, port, username, password, command, buffer_chars=STREAM_BUFFER_CHARS,
+                 spill_path=None, pool=None):
+        self.host, self.port, self.username, self.password = host, port, username, password
+        self.command = command
+        self.buffer = OutputRingBuffer(buffer_chars)
+        self.spill_path = spill_path
+        self.exit_status = None
+        self.bytes_received = 0
+        self.cancelled = False
+        self._cancel = threading.Event()
+        self._pool = pool or SSH_POOL
+
+    def cancel(self):
+        """Stops reading and closes the channel at the next chunk boundary."""
+        self._cancel.set()
+
+    def __iter__(self):
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+        spill = None
+        if self.spill_path:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            spill = open(self.spill_path, "wb")
+        try:
+            with self._pool.session(self.host, self.port, self.username, self.password) as channel:
+                channel.exec_command(self.command)
+                while True:
+                    if self._cancel.is_set():
+                        self.cancelled = True
+                        return
+                    got_data = False
+                    for name, ready, recv in (("stdout", channel.recv_ready, channel.recv),
+                                              ("stderr", channel.recv_stderr_ready, channel.recv_stderr)):
+                        if ready():
+                            data = recv(STREAM_CHUNK_SIZE)
+                            if not data:
+                                continue
+                            got_data = True
+                            self.bytes_received += len(data)
+                            if spill:
+                                spill.write(data)
+                            text = decoders[name].decode(data)
+                            if text:
+                                self.buffer.append(text)
+                                yield name, text
+                    if got_data:
+                        continue
+                    if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                        break
+                    select.select([channel], [], [], 0.1)  # wake as soon as more output arrives
+                self.exit_status = channel.recv_exit_status()
+        finally:
+            if spill:
+                spill.close()
+
+def stream_remote_command(host, port, username, password, command, spill_to_disk=False,
+                          buffer_chars=STREAM_BUFFER_CHARS):
+    """Returns a RemoteCommandStream; with `spill_to_disk` the full output goes to SSH_LOG_DIR."""
+    spill_path = None
+    if spill_to_disk:
+        spill_path = os.path.join(SSH_LOG_DIR, time.strftime("%Y%m%d_%H%M%S") + f"_{host}.log")
+    return RemoteCommandStream(host, port, username, password, command, buffer_chars, spill_path)
+
+# =================================================================
+# --- Read-Only Command Result Cache ---
+# =================================================================
+# Hardware and OS facts (lscpu, lsblk, uname -a...) don't change between
+# clicks, so their output is reused for a per-command TTL. Only commands listed
+# verbatim in CACHEABLE_COMMAND_TTLS are ever cached; anything else, and in
+# particular anything with side effects, always runs on the server.
+
+HARDWARE_TTL = 6 * 3600
+CONFIG_TTL = 300
+LIVE_TTL = 5
+
+CACHEABLE_COMMAND_TTLS = {
+    # Hardware / OS facts
+    "uname -a": HARDWARE_TTL,
+    "uname -r": HARDWARE_TTL,
+    "lscpu": HARDWARE_TTL,
+    "lsblk": HARDWARE_TTL,
+    "getconf LONG_BIT": HARDWARE_TTL,
+    "hostname": HARDWARE_TTL,
+    "sudo dmidecode -t bios": HARDWARE_TTL,
+    "lspci": HARDWARE_TTL,
+    "lsusb": HARDWARE_TTL,
+    # Configuration that rarely changes
+    "cut -d: -f1 /etc/passwd": CONFIG_TTL,
+    "ip a": CONFIG_TTL,
+    "ip route": CONFIG_TTL,
+    "hostname -I": CONFIG_TTL,
+    "mount | column -t": CONFIG_TTL,
+    "sestatus": CONFIG_TTL,
+    # Live state: only absorbs repeated clicks
+    "ps aux --sort=-%mem | head -11": LIVE_TTL,
+    "ps aux --sort=-%cpu | head -11": LIVE_TTL,
+    "ss -tuln": LIVE_TTL,
+    "ss -s": LIVE_TTL,
+    "free -h": LIVE_TTL,
+    "df -h": LIVE_TTL,
+}
+
+def format_age(seconds):
+    """Formats an age in seconds as '12s', '4m' or '3h'."""
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h"
+
+class CommandResultCache:
+    """Thread-safe (host, command) -> output cache restricted to the read-only allowlist."""
+    def __init__(self, ttls=None):
+        self.ttls = CACHEABLE_COMMAND_TTLS if ttls is None else ttls
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, command):
+        """Returns the TTL in seconds for an allowlisted command, else 0 (never cached)."""
+        return self.ttls.get(command.strip(), 0)
+
+    def get(self, host, command):
+        """Returns {"output", "exit_status", "age", "ttl"} for a fresh entry, else None."""
+        ttl = self.ttl_for(command)
+        if not ttl:
+            return None
+        with self._lock:
+            entry = self._entries.get((host, command.strip()))
+            age = time.time() - entry["stored_at"] if entry else None
+            if entry is None or age > ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {"output": entry["output"], "exit_status": entry["exit_status"], "age": age, "ttl": ttl}
+
+    def put(self, host, command, output, exit_status):
+        """Stores a successful result of an allowlisted command; other results are ignored."""
+        if exit_status != 0 or not self.ttl_for(command):
+            return False
+        with self._lock:
+            self._entries[(host, command.strip())] = {"output": output, "exit_status": exit_status,
+                                                      "stored_at": time.time()}
+        return True
+
+    def invalidate(self, host=None, command=None):
+        """Drops entries for a host/command (both None clears everything)."""
+        with self._lock:
+            for key in list(self._entries):
+                if (host is None or key[0] == host) and (command is None or key[1] == command.strip()):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+RESULT_CACHE = get_shared("command_result_cache", CommandResultCache)
+
+# =================================================================
+# --- Multi-Host Fan-Out ---
+# =================================================================
+# The same command can be run on many hosts from a saved inventory. Hosts are
+# contacted in parallel over pooled connections, with a cap on concurrency and
+# a per-host timeout; results are tabulated, identical outputs are grouped,
+# and the wall-clock time is reported against the sum of per-host latencies.
+
+HOST_INVENTORY_FILE = "ssh_hosts.json"
+
+def load_host_inventory():
+    """Loads the host inventory (a list of host dicts) from JSON."""
+    if not os.path.exists(HOST_INVENTORY_FILE):
+        return []
+    try:
+        with open(HOST_INVENTORY_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"Error loading host inventory: {e}")
+        return []
+
+def save_host_inventory(hosts):
+    """Saves the host inventory to JSON."""
+    try:
+        with open(HOST_INVENTORY_FILE, 'w', encoding='utf-8') as f:
+            json.dump(hosts, f, indent=2)
+    except IOError as e:
+        print(f"Error saving host inventory: {e}")
+
+def add_host_to_inventory(name, host, port=22, username="", password=""):
+    """Adds or replaces a host entry (matched by name) and returns the updated inventory."""
+    hosts = [h for h in load_host_inventory() if h["name"] != name]
+    hosts.append({"name": name, "host": host, "port": int(port), "username": username, "password": password})
+    save_host_inventory(hosts)
+    return hosts
+
+def remove_host_from_inventory(name):
+    """Removes a host entry by name and returns the updated inventory."""
+    hosts = [h for h in load_host_inventory() if h["name"] != name]
+    save_host_inventory(hosts)
+    return hosts
+
+def _run_on_host(entry, command, timeout, default_username, default_password):
+    start = time.perf_counter()
+    result = {"name": entry["name"], "host": entry["host"]}
+    try:
+        status, stdout, stderr = SSH_POOL.run(entry["host"], entry.get("port", 22),
+                                              entry.get("username") or default_username,
+                                              entry.get("password") or default_password,
+                                              command, timeout=timeout)
+        result.update(status="ok" if status == 0 else "failed", exit_status=status,
+                      output=stdout if stdout else stderr)
+    except paramiko.AuthenticationException:
+        result.update(status="auth error", exit_status=None, output="Authentication failed.")
+    except Exception as e:
+        result.update(status="error", exit_status=None, output=str(e) or type(e).__name__)
+    result["latency_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+def run_on_hosts(hosts, command, max_concurrency=10, timeout=15, default_username="", default_password=""):
+    """
+    Runs `command` on every host entry in parallel.
+    Returns (results DataFrame, {"wall_s", "sum_latency_s", "speedup"}).
+    """
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(hosts) or 1)),
+                              thread_name_prefix="fanout")
+    futures = {pool.submit(_run_on_host, h, command, timeout, default_username, default_password): h
+               for h in hosts}
+    # Hard stop for hosts that hang past connect + command timeouts.
+    done, not_done = wait(futures, timeout=timeout * 2 + SSH_POOL.connect_timeout)
+    pool.shutdown(wait=False, cancel_futures=True)
+    results = [f.result() for f in done]
+    for f in not_done:
+        h = futures[f]
+        results.append({"name": h["name"], "host": h["host"], "status": "timeout", "exit_status": None,
+                        "output": "No response before the timeout.", "latency_s": None})
+    wall = time.perf_counter() - started
+    df = pd.DataFrame(results, columns=["name", "host", "status", "exit_status", "latency_s", "output"])
+    total_latency = float(df["latency_s"].fillna(0).sum()) if len(df) else 0.0
+    timing = {"wall_s": round(wall, 3), "sum_latency_s": round(total_latency, 3),
+              "speedup": round(total_latency / wall, 2) if wall else 0.0}
+    return df.sort_values("name").reset_index(drop=True), timing
+
+def group_identical_outputs(results_df):
+    """Groups hosts that returned byte-identical output; largest groups first."""
+    if results_df.empty:
+        return pd.DataFrame(columns=["hosts", "count", "output"])
+    grouped = results_df.groupby("output", sort=False)["name"].agg(lambda names: ", ".join(sorted(names)))
+    counts = results_df.groupby("output", sort=False)["name"].count()
+    out = pd.DataFrame({"hosts": grouped, "count": counts}).reset_index()
+    return out.sort_values("count", ascending=False)[["hosts", "count", "output"]].reset_index(drop=True)
+
+# =================================================================
+# --- One-Round-Trip System Snapshot ---
+# =================================================================
+# Instead of a dozen separate menu commands, one composite script runs over a
+# single channel and prints each section after a delimiter line. The output
+# is split on the delimiters and parsed into typed records and DataFrames.
+# Sections use machine-friendly flags (bytes, POSIX df, fixed ps columns)
+# so no human-readable units have to be parsed back.
+
+SNAPSHOT_MARKER = "=====UAH-SECTION"
+SNAPSHOT_SECTIONS = {
+    "hostname": "hostname",
+    "kernel": "uname -srm",
+    "uptime": "cat /proc/uptime",
+    "loadavg": "cat /proc/loadavg",
+    "nproc": "nproc",
+    "users": "who | wc -l",
+    "memory": "free -b",
+    "disks": "df -P -B1 -x tmpfs -x devtmpfs -x squashfs -x overlay",
+    "top_cpu": "ps -eo pid,user,pcpu,pmem,rss,comm --sort=-pcpu | head -n 11",
+    "top_mem": "ps -eo pid,user,pcpu,pmem,rss,comm --sort=-pmem | head -n 11",
+    "sockets": "ss -s",
+}
+
+def build_snapshot_script():
+    """Returns the composite shell script that prints every snapshot section."""
+    parts = ["export LC_ALL=C"]
+    for name, command in SNAPSHOT_SECTIONS.items():
+        parts.append(f"echo '{SNAPSHOT_MARKER} {name}'")
+        parts.append(f"{{ {command}; }} 2>/dev/null")
+    return "\n".join(parts)
+
+def _split_sections(text):
+    sections, current = {}, None
+    for line in text.splitlines():
+        if line.startswith(SNAPSHOT_MARKER):
+            current = line[len(SNAPSHOT_MARKER):].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return sections
+
+def _parse_ps(lines):
+    rows = []
+    for line in lines[1:]:
+        parts = line.split(None, 5)
+        if len(parts) == 6:
+            pid, user, pcpu, pmem, rss, comm = parts
+            rows.append([int(pid), user, float(pcpu), float(pmem), int(rss) * 1024, comm])
+    return pd.DataFrame(rows, columns=["pid", "user", "cpu_pct", "mem_pct", "rss_bytes", "command"])
+
+def _parse_memory(lines):
+    rows = []
+    for line in lines[1:]:
+        parts = line.split()
+        if parts and parts[0].endswith(":"):
+            values = [int(v) for v in parts[1:]]
+            total, used, free = (values + [0, 0, 0])[:3]
+            available = values[5] if len(values) > 5 else free
+            rows.append([parts[0].rstrip(":"), total, used, free, available])
+    return pd.DataFrame(rows, columns=["kind", "total", "used", "free", "available"])
+
+def _parse_disks(lines):
+    rows = []
+    for line in lines[1:]:
+        parts = line.split(None, 5)
+        if len(parts) == 6 and parts[1].isdigit():
+            fs, size, used, avail, pct, mount = parts
+            rows.append([fs, int(size), int(used), int(avail), int(pct.rstrip("%") or 0), mount])
+    return pd.DataFrame(rows, columns=["filesystem", "size", "used", "available", "use_pct", "mount"])
+
+def _parse_sockets(lines):
+    summary = {}
+    for line in lines:
+        m = re.match(r"^(Total|TCP):\s+(\d+)(?:\s+\((.*)\))?", line)
+        if m:
+            summary[m.group(1).lower()] = int(m.group(2))
+            for key, value in re.findall(r"([\w/]+)\s+(\d+)", m.group(3) or ""):
+                summary[f"{m.group(1).lower()}_{key}"] = int(value)
+    return summary
+
+def _first(lines, default=""):
+    return lines[0].strip() if lines else default
+
+def parse_snapshot_output(text):
+    """Parses composite snapshot output into a dict of typed values and DataFrames."""
+    sec = _split_sections(text)
+    uptime = _first(sec.get("uptime", [])).split()
+    load = _first(sec.get("loadavg", [])).split()
+    nproc = _first(sec.get("nproc", []), "0")
+    users = _first(sec.get("users", []), "0")
+    return {
+        "hostname": _first(sec.get("hostname", [])),
+        "kernel": _first(sec.get("kernel", [])),
+        "uptime_s": float(uptime[0]) if uptime else None,
+        "load": tuple(float(v) for v in load[:3]) if len(load) >= 3 else None,
+        "cpus": int(nproc) if nproc.isdigit() else None,
+        "users": int(users) if users.isdigit() else None,
+        "memory": _parse_memory(sec.get("memory", [])),
+        "disks": _parse_disks(sec.get("disks", [])),
+        "top_cpu": _parse_ps(sec.get("top_cpu", [])),
+        "top_mem": _parse_ps(sec.get("top_mem", [])),
+        "sockets": _parse_sockets(sec.get("sockets", [])),
+    }
+
+def collect_system_snapshot(host, port, username, password, timeout=30):
+    """Collects a full system snapshot in one remote round trip; returns the parsed dict or an error string."""
+    try:
+        started = time.perf_counter()
+        _status, output, _error = SSH_POOL.run(host, port, username, password, build_snapshot_script(), timeout)
+        snapshot = parse_snapshot_output(output)
+        snapshot["collected_in_s"] = round(time.perf_counter() - started, 3)
+        return snapshot
+    except paramiko.AuthenticationException:
+        return "SSH Authentication Error: Please check your username and password in my_secrets.py."
+    except Exception as e:
+        return f"An unexpected SSH error occurred: {e}"
+
+# =================================================================
+# --- Remote Metrics Poller ---
+# =================================================================
+# A background poller samples CPU, memory and root-disk usage from the target
+# at a fixed interval over the pooled SSH session. Each sample is one tiny
+# command reading /proc/stat, /proc/meminfo and `df /`, so the remote cost is
+# negligible. Samples go into an in-memory ring buffer for live charts and
+# into SQLite; raw rows older than the raw retention window are downsampled
+# into one-minute averages so the database stays small.
+
+METRICS_DB_FILE = "ssh_metrics.db"
+METRICS_SAMPLE_COMMAND = (
+    "head -n 1 /proc/stat; grep -E '^(MemTotal|MemAvailable):' /proc/meminfo; df -P -B1 / | tail -n 1"
+)
+METRICS_COLUMNS = ["ts", "cpu_pct", "mem_pct", "mem_used", "mem_total", "disk_pct"]
+
+def parse_metrics_sample(text, previous_cpu=None):
+    """
+    Parses one sample; returns (metrics dict, cpu counters). CPU% needs the previous
+    counters, so the first sample has cpu_pct None.
+    """
+    lines = text.strip().splitlines()
+    cpu_fields = [int(v) for v in lines[0].split()[1:]]
+    idle = cpu_fields[3] + (cpu_fields[4] if len(cpu_fields) > 4 else 0)  # idle + iowait
+    cpu = (sum(cpu_fields), idle)
+    cpu_pct = None
+    if previous_cpu is not None and cpu[0] > previous_cpu[0]:
+        busy = (cpu[0] - previous_cpu[0]) - (cpu[1] - previous_cpu[1])
+        cpu_pct = round(100.0 * busy / (cpu[0] - previous_cpu[0]), 2)
+    mem = {}
+    for line in lines[1:3]:
+        key, value = line.split(":", 1)
+        mem[key] = int(value.split()[0]) * 1024
+    total, available = mem.get("MemTotal", 0), mem.get("MemAvailable", 0)
+    disk = lines[3].split()
+    disk_pct = round(100.0 * int(disk[2]) / int(disk[1]), 2) if len(disk) >= 4 and int(disk[1]) else None
+    return {
+        "ts": time.time(),
+        "cpu_pct": cpu_pct,
+        "mem_pct": round(100.0 * (total - available) / total, 2) if total else None,
+        "mem_used": total - available,
+        "mem_total": total,
+        "disk_pct": disk_pct,
+    }, cpu
+
+class MetricsStore:
+    """SQLite time-series store with raw samples plus one-minute downsampled averages."""
+    def __init__(self, path=METRICS_DB_FILE, raw_retention_s=6 * 3600):
+        self.raw_retention_s = raw_retention_s
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            for table in ("samples", "samples_1m"):
+                self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (host TEXT, ts REAL, cpu_pct REAL, "
+                                 "mem_pct REAL, mem_used INTEGER, mem_total INTEGER, disk_pct REAL)")
+                self._db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_host_ts ON {table} (host, ts)")
+
+    def add(self, host, sample):
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [host] + [sample[c] for c in METRICS_COLUMNS])
+
+    def downsample(self, host):
+        """Folds raw samples older than the retention window into one-minute averages."""
+        cutoff = time.time() - self.raw_retention_s
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO samples_1m SELECT host, CAST(ts / 60 AS INTEGER) * 60, AVG(cpu_pct), AVG(mem_pct), "
+                "CAST(AVG(mem_used) AS INTEGER), MAX(mem_total), AVG(disk_pct) FROM samples "
+                "WHERE host = ? AND ts < ? GROUP BY host, CAST(ts / 60 AS INTEGER)", (host, cutoff))
+            self._db.execute("DELETE FROM samples WHERE host = ? AND ts < ?", (host, cutoff))
+
+    def history(self, host, since_s=24 * 3600):
+        """Returns downsampled plus raw samples for the last `since_s` seconds as a DataFrame."""
+        since = time.time() - since_s
+        query = ("SELECT ts, cpu_pct, mem_pct, mem_used, mem_total, disk_pct FROM samples_1m WHERE host = ? AND ts >= ? "
+                 "UNION ALL SELECT ts, cpu_pct, mem_pct, mem_used, mem_total, disk_pct FROM samples "
+                 "WHERE host = ? AND ts >= ? ORDER BY ts")
+        with self._lock:
+            df = pd.read_sql_query(query, self._db, params=(host, since, host, since))
+        df["time"] = pd.to_datetime(df["ts"], unit="s")
+        return df
+
+class MetricsPoller:
+    """Background sampler for one SSH target, feeding a ring buffer and a MetricsStore."""
+    def __init__(self, host, port, username, password, interval=5.0, store=None, ring_size=720):
+        self.host, self.port, self.username, self.password = host, port, username, password
+        self.interval = interval
+        self.store = store
+        self.ring = deque(maxlen=ring_size)
+        self.errors = 0
+        self.last_error = None
+        self.last_latency_s = None
+        self._previous_cpu = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.is_running():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def sample_once(self):
+        started = time.perf_counter()
+        _status, output, _err = SSH_POOL.run(self.host, self.port, self.username, self.password,
+                                             METRICS_SAMPLE_COMMAND, timeout=max(self.interval, 5))
+        self.last_latency_s = round(time.perf_counter() - started, 3)
+        sample, self._previous_cpu = parse_metrics_sample(output, self._previous_cpu)
+        if sample["cpu_pct"] is None:
+            return None  # first sample only primes the CPU counters
+        self.ring.append(sample)
+        if self.store is not None:
+            self.store.add(self.host, sample)
+        return sample
+
+    def _loop(self):
+        samples = 0
+        while not self._stop.is_set():
+            try:
+                self.sample_once()
+                samples += 1
+                if self.store is not None and samples % 120 == 0:
+                    self.store.downsample(self.host)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+            self._stop.wait(self.interval)
+
+    def recent(self):
+        """Returns the in-memory samples as a DataFrame."""
+        df = pd.DataFrame(list(self.ring), columns=METRICS_COLUMNS)
+        df["time"] = pd.to_datetime(df["ts"], unit="s")
+        return df
+
+def get_metrics_poller(host, port, username, password, interval=5.0):
+    """Returns the shared poller for a host, updating its interval."""
+    store = get_shared("metrics_store", MetricsStore)
+    poller = get_shared(("metrics_poller", host, port, username),
+                        lambda: MetricsPoller(host, port, username, password, interval, store))
+    poller.interval = interval
+    return poller
+
+# =================================================================
+# --- Parallel SFTP Transfers ---
+# =================================================================
+# Files move over SFTP channels on the pooled transport. Large files are split
+# into fixed-size ranges that several channels transfer concurrently, each with
+# pipelined requests; small files are batched so every channel works through a
+# queue of them instead of opening a channel per file. Ranged transfers write
+# to a ".part" file and record finished ranges under SFTP_STATE_DIR, so an
+# interrupted transfer started again with the same paths resumes where it
+# stopped. Checksums are verified afterwards with one `sha256sum` per batch.
+
+SFTP_STREAMS = 3  # leaves one of the pool's four session slots for commands
+SFTP_RANGE_SIZE = 8 * 1024 * 1024
+SFTP_RANGED_MIN_SIZE = 32 * 1024 * 1024
+SFTP_BLOCK_SIZE = 1024 * 1024
+SFTP_VERIFY_BATCH = 50
+SFTP_STATE_DIR = "sftp_state"
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(SFTP_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def remote_sha256_many(host, port, username, password, remote_paths, pool=None):
+    """Returns {path: sha256} for remote files, one `sha256sum` call per batch (missing entries = unknown)."""
+    hashes = {}
+    for i in range(0, len(remote_paths), SFTP_VERIFY_BATCH):
+        batch = remote_paths[i:i + SFTP_VERIFY_BATCH]
+        _status, out, _err = (pool or SSH_POOL).run(
+            host, port, username, password, "sha256sum -- " + " ".join(shlex.quote(p) for p in batch))
+        for line in out.splitlines():
+            digest, _sep, path = line.partition("  ")
+            if path:
+                hashes[path] = digest
+    return hashes
+
+def _sftp_makedirs(sftp, remote_dir):
+    path = ""
+    for part in remote_dir.split("/"):
+        path = f"{path}/{part}" if path or remote_dir.startswith("/") else part
+        if not part:
+            continue
+        try:
+            sftp.stat(path)
+        except IOError:
+            try:
+                sftp.mkdir(path)
+            except IOError:
+                sftp.stat(path)  # another channel created it first; re-raise only if it's still missing
+
+def _sftp_replace(sftp, src, dst):
+    try:
+        sftp.posix_rename(src, dst)
+    except IOError:
+        # Servers without the posix-rename extension refuse to overwrite.
+        try:
+            sftp.remove(dst)
+        except IOError:
+            pass
+        sftp.rename(src, dst)
+
+def _sftp_is_dir(sftp, path):
+    try:
+        return stat.S_ISDIR(sftp.stat(path).st_mode)
+    except IOError:
+        return False
+
+def walk_remote_files(sftp, remote_dir):
+    """Yields (path, SFTPAttributes) for every file below a remote folder."""
+    for attr in sftp.listdir_attr(remote_dir):
+        path = posixpath.join(remote_dir, attr.filename)
+        if stat.S_ISDIR(attr.st_mode):
+            yield from walk_remote_files(sftp, path)
+        elif stat.S_ISREG(attr.st_mode):
+            yield path, attr
+
+class SFTPTransferJob:
+    """Uploads or downloads a file or folder in a background thread and exposes its progress."""
+    def __init__(self, direction, host, port, username, password, source, destination,
+                 streams=SFTP_STREAMS, verify=True, pool=None, ranged_min_size=SFTP_RANGED_MIN_SIZE):
+        if direction not in ("upload", "download"):
+            raise ValueError("direction must be 'upload' or 'download'")
+        self.direction = direction
+        self.host, self.port, self.username, self.password = host, port, username, password
+        self.source = source
+        self.destination = destination
+        self.verify = verify
+        self.ranged_min_size = ranged_min_size
+        self._pool = pool or SSH_POOL
+        self.streams = max(1, min(streams, self._pool.max_sessions_per_host - 1))
+        self.results = []
+        self.files_total = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.resumed_bytes = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self
+
+    def _sftp(self):
+        return self._pool.sftp(self.host, self.port, self.username, self.password)
+
+    def _add_bytes(self, n):
+        with self._lock:
+            self.bytes_done += n
+
+    def _record(self, src, dst, size, started, mode, error=None):
+        with self._lock:
+            self.results.append({"source": src, "destination": dst, "bytes": size, "mode": mode,
+                                 "seconds": round(time.time() - started, 3), "verified": None, "error": error})
+
+    def _plan(self):
+        """Returns [(source, destination, size, mtime)] for every file to transfer."""
+        with self._sftp() as sftp:
+            if self.direction == "upload":
+                if os.path.isdir(self.source):
+                    plan = []
+                    for dirpath, _dirs, files in os.walk(self.source):
+                        rel = os.path.relpath(dirpath, self.source)
+                        remote_dir = self.destination if rel == "." else posixpath.join(self.destination, *rel.split(os.sep))
+                        for name in files:
+                            st = os.stat(os.path.join(dirpath, name))
+                            plan.append((os.path.join(dirpath, name), posixpath.join(remote_dir, name), st.st_size, st.st_mtime))
+                    return plan
+                dst = self.destination
+                if _sftp_is_dir(sftp, dst):
+                    dst = posixpath.join(dst, os.path.basename(self.source))
+                st = os.stat(self.source)
+                return [(self.source, dst, st.st_size, st.st_mtime)]
+            attr = sftp.stat(self.source)
+            if stat.S_ISDIR(attr.st_mode):
+                return [(path, os.path.join(self.destination, *posixpath.relpath(path, self.source).split("/")),
+                         a.st_size, a.st_mtime) for path, a in walk_remote_files(sftp, self.source)]
+            dst = self.destination
+            if os.path.isdir(dst):
+                dst = os.path.join(dst, posixpath.basename(self.source))
+            return [(self.source, dst, attr.st_size, attr.st_mtime)]
+
+    def _run(self):
+        try:
+            plan = self._plan()
+            self.files_total = len(plan)
+            self.bytes_total = sum(item[2] for item in plan)
+            small = [item for item in plan if item[2] < self.ranged_min_size]
+            if small:
+                self._run_batched(small)
+            for item in (item for item in plan if item[2] >= self.ranged_min_size):
+                if self._cancel.is_set():
+                    break
+                self._run_ranged(*item)
+            if self.verify and not self._cancel.is_set():
+                self._verify()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+
+    # --- Small files: one queue shared by all channels ---
+    def _run_batched(self, items):
+        pending = deque(items)
+
+        def worker():
+            with self._sftp() as sftp:
+                while not self._cancel.is_set():
+                    try:
+                        src, dst, size, _mtime = pending.popleft()
+                    except IndexError:
+                        return
+                    self._transfer_whole(sftp, src, dst, size)
+
+        with ThreadPoolExecutor(max_workers=min(self.streams, len(items)), thread_name_prefix="sftp") as ex:
+            for future in [ex.submit(worker) for _ in range(min(self.streams, len(items)))]:
+                future.result()
+
+    def _transfer_whole(self, sftp, src, dst, size):
+        started = time.time()
+        part = dst + ".part"
+        seen = [0]
+
+        def progress(done, _total):
+            self._add_bytes(done - seen[0])
+            seen[0] = done
+
+        try:
+            if self.direction == "upload":
+                _sftp_makedirs(sftp, posixpath.dirname(dst))
+                sftp.put(src, part, callback=progress)
+                _sftp_replace(sftp, part, dst)
+            else:
+                os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                sftp.get(src, part, callback=progress)
+                os.replace(part, dst)
+            self._record(src, dst, size, started, "batched")
+        except Exception as e:
+            self._record(src, dst, size, started, "batched", str(e))
+
+    # --- Large files: ranges spread over several channels ---
+    def _state_path(self, src, dst, size, mtime):
+        key = json.dumps([self.direction, self.host, self.port, self.username, src, dst, size, int(mtime)])
+        return os.path.join(SFTP_STATE_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def _load_done(self, state_path, part, size):
+        """Returns the finished range indexes of an earlier attempt whose .part file is still intact."""
+        try:
+            with open(state_path, "r") as f:
+                done = set(json.load(f)["done"])
+            if self.direction == "upload":
+                with self._sftp() as sftp:
+                    intact = sftp.stat(part).st_size == size
+            else:
+                intact = os.path.getsize(part) == size
+            return done if intact else set()
+        except (OSError, IOError, ValueError, KeyError):
+            return set()
+
+    def _save_done(self, state_path, src, done):
+        with self._lock:
+            os.makedirs(SFTP_STATE_DIR, exist_ok=True)
+            with open(state_path, "w") as f:
+                json.dump({"source": src, "done": sorted(done)}, f)
+
+    def _run_ranged(self, src, dst, size, mtime):
+        started = time.time()
+        part = dst + ".part"
+        ranges = [(off, min(SFTP_RANGE_SIZE, size - off)) for off in range(0, size, SFTP_RANGE_SIZE)]
+        state_path = self._state_path(src, dst, size, mtime)
+        done = self._load_done(state_path, part, size)
+        try:
+            if not done:
+                # Pre-size the .part file so every range can be written in place.
+                if self.direction == "upload":
+                    with self._sftp() as sftp:
+                        _sftp_makedirs(sftp, posixpath.dirname(dst))
+                        with sftp.open(part, "wb") as f:
+                            f.truncate(size)
+                else:
+                    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+                    with open(part, "wb") as f:
+                        f.truncate(size)
+            resumed = sum(ranges[i][1] for i in done)
+            with self._lock:
+                self.resumed_bytes += resumed
+                self.bytes_done += resumed
+            pending = deque(i for i in range(len(ranges)) if i not in done)
+            transfer = self._download_ranges if self.direction == "download" else self._upload_ranges
+            workers = min(self.streams, len(pending)) or 1
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sftp") as ex:
+                for future in [ex.submit(transfer, src, part, ranges, pending, done, state_path) for _ in range(workers)]:
+                    future.result()
+            if len(done) < len(ranges):
+                self._record(src, dst, size, started, "ranged", "Interrupted; start the transfer again to resume.")
+                return
+            if self.direction == "upload":
+                with self._sftp() as sftp:
+                    _sftp_replace(sftp, part, dst)
+            else:
+                os.replace(part, dst)
+            try:
+                os.remove(state_path)
+            except OSError:
+                pass
+            self._record(src, dst, size, started, "ranged")
+        except Exception as e:
+            self._record(src, dst, size, started, "ranged", f"{e} (resumable)")
+
+    @staticmethod
+    def _blocks(offset, length):
+        return [(o, min(SFTP_BLOCK_SIZE, offset + length - o)) for o in range(offset, offset + length, SFTP_BLOCK_SIZE)]
+
+    def _download_ranges(self, src, part, ranges, pending, done, state_path):
+        with self._sftp() as sftp, sftp.open(src, "rb") as remote, open(part, "r+b") as local:
+            while not self._cancel.is_set():
+                try:
+                    index = pending.popleft()
+                except IndexError:
+                    return
+                blocks = self._blocks(*ranges[index])
+                # readv issues every read request of the range up front (pipelined).
+                for (offset, _length), data in zip(blocks, remote.readv(blocks)):
+                    if self._cancel.is_set():
+                        return
+                    local.seek(offset)
+                    local.write(data)
+                    self._add_bytes(len(data))
+                local.flush()
+                done.add(index)
+                self._save_done(state_path, src, done)
+
+    def _upload_ranges(self, src, part, ranges, pending, done, state_path):
+        with self._sftp() as sftp, open(src, "rb") as local:
+            while not self._cancel.is_set():
+                try:
+                    index = pending.popleft()
+                except IndexError:
+                    return
+                # Pipelined writes don't wait for each ack; closing the handle waits for all of them.
+                with sftp.open(part, "r+b") as remote:
+                    remote.set_pipelined(True)
+                    for offset, length in self._blocks(*ranges[index]):
+                        if self._cancel.is_set():
+                            return
+                        local.seek(offset)
+                        data = local.read(length)
+                        remote.seek(offset)
+                        remote.write(data)
+                        self._add_bytes(len(data))
+                done.add(index)
+                self._save_done(state_path, src, done)
+
+    def _verify(self):
+        """Compares SHA-256 of each transferred file on both ends (None when the server can't hash)."""
+        finished = [r for r in self.results if not r["error"]]
+        if not finished:
+            return
+        local_key, remote_key = ("source", "destination") if self.direction == "upload" else ("destination", "source")
+        remote_hashes = remote_sha256_many(self.host, self.port, self.username, self.password,
+                                           [r[remote_key] for r in finished], self._pool)
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            local_hashes = list(ex.map(_sha256_file, [r[local_key] for r in finished]))
+        for result, local_hash in zip(finished, local_hashes):
+            remote_hash = remote_hashes.get(result[remote_key])
+            result["verified"] = None if remote_hash is None else remote_hash == local_hash
+            if result["verified"] is False:
+                result["error"] = "Checksum mismatch"
+
+    def progress(self):
+        """Returns a snapshot of progress counters."""
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        moved = self.bytes_done - self.resumed_bytes
+        return {
+            "files_done": len(self.results),
+            "files_total": self.files_total,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "resumed_bytes": self.resumed_bytes,
+            "fraction": self.bytes_done / self.bytes_total if self.bytes_total else (0.0 if self.is_running() else 1.0),
+            "mb_per_s": round(moved / 1e6 / elapsed, 2) if elapsed else 0.0,
+            "errors": [f"{r['source']}: {r['error']}" for r in self.results if r["error"]] +
+                      ([self.error] if self.error else []),
+            "cancelled": self._cancel.is_set(),
+        }
+
+    def results_dataframe(self):
+        return pd.DataFrame(self.results, columns=["source", "destination", "bytes", "mode", "seconds", "verified", "error"])
+
+def start_sftp_transfer(direction, host, port, username, password, source, destination,
+                        streams=SFTP_STREAMS, verify=True):
+    """Starts an upload or download in the background and returns its SFTPTransferJob."""
+    return SFTPTransferJob(direction, host, port, username, password, source, destination, streams, verify).start()
+
+def benchmark_sftp_download(host, port, username, password, remote_path, streams=SFTP_STREAMS, pool=None):
+    """Downloads a remote file with one stream and then with `streams` channels; returns both speeds."""
+    pool = pool or SSH_POOL
+    tmp_dir = tempfile.mkdtemp(prefix="sftp_bench_")
+    try:
+        speeds = {}
+        for label, n in (("single_stream", 1), ("parallel", streams)):
+            job = SFTPTransferJob("download", host, port, username, password, remote_path, os.path.join(tmp_dir, label),
+                                  n, verify=False, pool=pool, ranged_min_size=0).start().wait()
+            errors = job.progress()["errors"]
+            if errors:
+                return f"Error: {errors[0]}"
+            speeds[label] = (job.bytes_total, job.finished_at - job.started_at, job.streams)
+        size, single, _ = speeds["single_stream"]
+        _, parallel, used = speeds["parallel"]
+        return {"bytes": size, "streams": used,
+                "single_stream_mb_s": round(size / 1e6 / single, 2) if single else 0.0,
+                "parallel_mb_s": round(size / 1e6 / parallel, 2) if parallel else 0.0,
+                "speedup": round(single / parallel, 2) if parallel else 0.0}
+    except Exception as e:
+        return f"An error occurred: {e}"
     finally:
-        ssh.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+# =================================================================
+# --- Remote File Browser ---
+# =================================================================
+# Browses the SSH target like the local File Manager. One SFTP listdir_attr
+# call returns names together with their stat data, and each listing is kept
+# for a TTL, so paging, sorting and filtering never go back to the server.
+# Subfolders of the folder being viewed are listed in the background so that
+# stepping into one is instant. Previews fetch only the bounded window shown.
+
+REMOTE_LISTING_TTL = 30
+REMOTE_PREFETCH_LIMIT = 16
+REMOTE_PREVIEW_MODES = [m for m in file_manager.PREVIEW_MODES if m != "Jump to line"]
+
+class RemoteDirectoryCache:
+    """TTL cache of SFTP folder listings for one host, with background prefetch of subfolders."""
+    def __init__(self, host, port, username, password, ttl=REMOTE_LISTING_TTL, pool=None):
+        self.host, self.port, self.username, self.password = host, port, username, password
+        self.ttl = ttl
+        self._pool = pool or SSH_POOL
+        self._listings = {}
+        self._lock = threading.Lock()
+        self._inflight = set()
+        # A single prefetch worker keeps background listing to one session slot.
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sftp-prefetch")
+        self.hits = 0
+        self.misses = 0
+        self.prefetched = 0
+
+    def _sftp(self):
+        return self._pool.sftp(self.host, self.port, self.username, self.password)
+
+    def _fresh(self, path):
+        entry = self._listings.get(path)
+        return entry if entry and time.time() - entry[0] <= self.ttl else None
+
+    def home(self):
+        """Returns the absolute path of the login directory."""
+        with self._sftp() as sftp:
+            return sftp.normalize(".")
+
+    def listing(self, path, refresh=False):
+        """Returns (list of SFTPAttributes, age in seconds) for a folder."""
+        path = posixpath.normpath(path)
+        with self._lock:
+            entry = None if refresh else self._fresh(path)
+            if entry:
+                self.hits += 1
+        if entry is None:
+            with self._sftp() as sftp:
+                attrs = sftp.listdir_attr(path)
+            entry = (time.time(), attrs)
+            with self._lock:
+                self.misses += 1
+                self._listings[path] = entry
+        self.prefetch_children(path, entry[1])
+        return entry[1], time.time() - entry[0]
+
+    def prefetch_children(self, path, attrs):
+        """Queues background listings of the first REMOTE_PREFETCH_LIMIT subfolders not cached yet."""
+        with self._lock:
+            todo = [posixpath.join(path, a.filename) for a in attrs if stat.S_ISDIR(a.st_mode or 0)]
+            todo = [p for p in todo if p not in self._inflight and not self._fresh(p)][:REMOTE_PREFETCH_LIMIT]
+            self._inflight.update(todo)
+        if todo:
+            self._prefetcher.submit(self._prefetch, todo)
+
+    def _prefetch(self, paths):
+        try:
+            with self._sftp() as sftp:
+                for path in paths:
+                    try:
+                        attrs = sftp.listdir_attr(path)
+                    except IOError:
+                        continue  # unreadable folder; the foreground listing will report it
+                    with self._lock:
+                        self._listings[path] = (time.time(), attrs)
+                        self.prefetched += 1
+        except Exception as e:
+            print(f"Remote prefetch failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight.difference_update(paths)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(posixpath.normpath(path), None)
+
+    def stats(self):
+        with self._lock:
+            return {"cached_folders": len(self._listings), "hits": self.hits, "misses": self.misses,
+                    "prefetched": self.prefetched}
+
+def get_remote_directory_cache(host, port, username, password):
+    """Returns the shared listing cache for a host."""
+    return get_shared(("remote_directory_cache", host, port, username),
+                      lambda: RemoteDirectoryCache(host, port, username, password))
+
+def get_remote_directory_page(cache, path, page=0, page_size=100, sort_by="Name", descending=False,
+                              name_filter=None, refresh=False):
+    """
+    Returns one page of a remote folder listing as (DataFrame, total_items, total_folders, age_seconds).
+    Sorting, filtering and paging run on the cached listing.
+    """
+    try:
+        attrs, age = cache.listing(path, refresh)
+        needle = name_filter.lower() if name_filter else None
+        folders, files = [], []
+        for a in attrs:
+            if needle and needle not in a.filename.lower():
+                continue
+            (folders if stat.S_ISDIR(a.st_mode or 0) else files).append(a)
+        if sort_by != "Directory order":
+            key = {"Name": lambda a: a.filename.lower(), "Size": lambda a: a.st_size or 0,
+                   "Modified": lambda a: a.st_mtime or 0}[sort_by]
+            # Folders always come first; the direction applies within each group.
+            folders.sort(key=key, reverse=descending)
+            files.sort(key=key, reverse=descending)
+        ordered = folders + files
+        start = max(page, 0) * page_size
+        rows = []
+        for a in ordered[start:start + page_size]:
+            is_dir = stat.S_ISDIR(a.st_mode or 0)
+            rows.append([a.filename, "📁 Folder" if is_dir else "📄 File",
+                         "-" if is_dir else file_manager.get_human_readable_size(a.st_size or 0),
+                         time.strftime("%Y-%m-%d %H:%M", time.localtime(a.st_mtime or 0))])
+        return pd.DataFrame(rows, columns=["Name", "Type", "Size", "Modified"]), len(ordered), len(folders), age
+    except IOError as e:
+        return f"Error: Cannot list remote folder: {e}"
+    except Exception as e:
+        return f"An error occurred: {e}"
+
+def preview_remote_file(host, port, username, password, path, mode="Head",
+                        window=file_manager.PREVIEW_WINDOW_BYTES, offset=0, pool=None):
+    """
+    Returns a bounded preview of a remote file in the same dict shape as file_manager.preview_file.
+    Only the sniffing sample and the requested window(s) are read, in one pipelined readv.
+    """
+    try:
+        with (pool or SSH_POOL).sftp(host, port, username, password) as sftp, sftp.open(path, "rb") as f:
+            size = f.stat().st_size
+            if size == 0:
+                return {"kind": "text", "content": "", "encoding": "utf-8", "start": 0, "end": 0,
+                        "size": 0, "truncated": False, "line": None}
+            if mode == "Tail":
+                start = max(size - window, 0)
+            elif mode == "Jump to byte offset":
+                start = min(max(int(offset), 0), size - 1)
+            else:
+                start = 0
+            end = min(start + window, size)
+            tail_start = max(end, size - window) if mode == "Head + Tail" and end < size else None
+            ranges = [(0, min(file_manager.PREVIEW_SAMPLE_BYTES, size)), (start, end - start)]
+            if tail_start is not None:
+                ranges.append((tail_start, size - tail_start))
+            blocks = list(f.readv(ranges))
+        sample, data = blocks[0], blocks[1]
+        tail = blocks[2] if tail_start is not None else None
+
+        if file_manager.is_binary_sample(sample):
+            content = file_manager.hex_dump(data, start)
+            if tail is not None:
+                content += "\n...\n" + file_manager.hex_dump(tail, tail_start)
+            return {"kind": "binary", "content": content, "encoding": None, "start": start,
+                    "end": end, "size": size, "truncated": end - start < size, "line": None}
+
+        encoding = file_manager.sniff_encoding(sample)
+        if encoding == "utf-16" and start % 2:
+            data, start = data[1:], start + 1
+        content, start, end = file_manager.decode_window(data, start, end, size, encoding, align_lines=mode != "Head")
+        if tail is not None:
+            tail_text, _, _ = file_manager.decode_window(tail, tail_start, size, size, encoding, align_lines=True)
+            content += "\n... [truncated] ...\n" + tail_text
+        return {"kind": "text", "content": content, "encoding": encoding, "start": start,
+                "end": end, "size": size, "truncated": end - start < size, "line": None}
+    except Exception as e:
+        return f"Cannot read file: {e}"
@@ -0,0 +1,199 @@
+# File Name: tests/test_ssh_connection_pool.py
+# Exercises SSHConnectionPool against an in-process paramiko SSH server.
+
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+paramiko = pytest.importorskip("paramiko")
+pytest.importorskip("google.generativeai")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ssh_gemini_manager  # noqa: E402
+
+PASSWORD = "secret"
+
+# =================================================================
+# --- Stub SSH Server ---
+# =================================================================
+
+class _StubInterface(paramiko.ServerInterface):
+    """Password auth plus exec: "sleep N" waits N seconds, anything else is echoed back."""
+    def __init__(self, server):
+        self.server = server
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == PASSWORD else paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.server.run_command, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+class StubSSHServer:
+    """Accepts SSH connections on a local port and records connections and concurrent commands."""
+    def __init__(self):
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.connections = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _addr = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            with self._lock:
+                self.connections += 1
+                self.transports.append(transport)
+            transport.start_server(server=_StubInterface(self))
+
+    def run_command(self, channel, command):
+        # paramiko sends the exec reply only after check_channel_exec_request returns;
+        # answering before that makes the client see a closed channel.
+        time.sleep(0.05)
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if command.startswith("sleep "):
+                time.sleep(float(command.split()[1]))
+                channel.sendall(b"slept\n")
+            else:
+                channel.sendall(f"ran: {command}\n".encode())
+        finally:
+            with self._lock:
+                self.running -= 1
+            channel.send_exit_status(0)
+            channel.close()
+
+    def drop_connections(self):
+        """Closes every server-side transport, as if the server restarted."""
+        with self._lock:
+            transports, self.transports = self.transports, []
+        for transport in transports:
+            transport.close()
+
+    def close(self):
+        self.drop_connections()
+        self.sock.close()
+
+@pytest.fixture
+def server():
+    srv = StubSSHServer()
+    yield srv
+    srv.close()
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def factory(**kwargs):
+        pool = ssh_gemini_manager.SSHConnectionPool(**kwargs)
+        pools.append(pool)
+        return pool
+
+    yield factory
+    for pool in pools:
+        pool.close_all()
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+# =================================================================
+# --- Tests ---
+# =================================================================
+
+def test_commands_reuse_one_transport(server, make_pool):
+    pool = make_pool()
+    for _ in range(3):
+        status, out, err = pool.run("127.0.0.1", server.port, "alice", PASSWORD, "uptime")
+        assert (status, out, err) == (0, "ran: uptime\n", "")
+    assert server.connections == 1
+    assert pool.connects == 1
+    assert pool.reuses == 2
+
+def test_reconnects_after_failed_health_check(server, make_pool):
+    pool = make_pool()
+    pool.run("127.0.0.1", server.port, "alice", PASSWORD, "hostname")
+    transport = pool.get_transport("127.0.0.1", server.port, "alice", PASSWORD)
+    server.drop_connections()
+    assert _wait_for(lambda: not transport.is_active())
+
+    status, out, _err = pool.run("127.0.0.1", server.port, "alice", PASSWORD, "hostname")
+    assert (status, out) == (0, "ran: hostname\n")
+    assert server.connections == 2
+    assert pool.connects == 2
+
+def test_changed_password_is_not_served_from_the_pool(server, make_pool):
+    pool = make_pool()
+    pool.run("127.0.0.1", server.port, "alice", PASSWORD, "whoami")
+    with pytest.raises(paramiko.AuthenticationException):
+        pool.run("127.0.0.1", server.port, "alice", "wrong", "whoami")
+
+def test_session_cap_limits_concurrent_channels(server, make_pool):
+    pool = make_pool(max_sessions_per_host=2)
+    results = []
+
+    def run():
+        results.append(pool.run("127.0.0.1", server.port, "alice", PASSWORD, "sleep 0.3"))
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert [r[1] for r in results] == ["slept\n"] * 4
+    assert server.max_running == 2
+    assert time.time() - started >= 0.6  # two waves of two
+    assert server.connections == 1
+
+def test_idle_connections_are_closed(server, make_pool):
+    pool = make_pool(idle_timeout=0.2)
+    pool.run("127.0.0.1", server.port, "alice", PASSWORD, "date")
+    assert pool.close_idle() == 0
+    time.sleep(0.3)
+    assert pool.close_idle() == 1
+    assert pool.stats()["open"] == 0
+
+def test_connections_with_open_sessions_are_not_reaped(server, make_pool):
+    pool = make_pool(idle_timeout=0.2)
+    with pool.session("127.0.0.1", server.port, "alice", PASSWORD) as channel:
+        time.sleep(0.3)
+        assert pool.close_idle() == 0
+        channel.exec_command("still here")
+        assert channel.makefile("rb").read() == b"ran: still here\n"
+    time.sleep(0.3)
+    assert pool.close_idle() == 1
+
+def test_reaper_thread_closes_idle_connections(server, make_pool):
+    pool = make_pool(idle_timeout=0.2)
+    pool.run("127.0.0.1", server.port, "alice", PASSWORD, "date")
+    # The reaper wakes at most once a second.
+    assert _wait_for(lambda: pool.stats()["open"] == 0, timeout=3.0)